@@ -26,7 +26,7 @@
 import argparse
 import json
 import math
-from utils import api_util
+from utils import api_util, http_util
 
 
 # Command line parser setup
@@ -75,6 +75,12 @@ group_api.add_argument('--api-port',
                     default=443,
                     help='API port (default: 443)')
 
+group_api.add_argument('--api-active-cache-ttl',
+                    dest='api_active_cache_ttl',
+                    type=int,  
+                    default=300,
+                    help='Seconds the number of active devices is reused by the non-compliant, quarantined and filter checks of the host with the same API user, 0 to disable cache (default: 300)')
+
 # Monitoring options
 group_general = parser.add_argument_group('Monitoring')
 parser.add_argument('--warning',
@@ -96,6 +102,12 @@ parser.add_argument('--maximum-devices',
                     choices=[5000, 20000, 50000, 100000],
                     help='Maximum number od devices supported (5 000, 20 000, 50 000, 100 000)')
 
+group_general.add_argument('--verbose',
+                    dest='verbose',
+                    type=int,
+                    default=0,
+                    help='Report HTTP bytes received and saved (compression, 304 Not Modified) in perfdata [0:disabled, 1:enabled] (default: 0)')
+
 def service_output(title: str, exit_code: int, message: str, perfdata: str = None):
     status = 'UNKNOWN'
     if exit_code == 0:
@@ -104,10 +116,26 @@ def service_output(title: str, exit_code: int, message: str, perfdata: str = Non
         status = "WARNING"
     if exit_code == 2:
         status = "CRITICAL"
+    if args.verbose == 1 :
+        perfdata = ' '.join(([perfdata] if perfdata != None else []) + [http_perfdata()])
     print("{} {} - {};{}".format(title, status, message, ('|'+perfdata if perfdata != None else '')))
     exit(exit_code)
 
 
+# HTTP body bytes received and saved by compression and 304 Not Modified responses (verbose)
+def http_perfdata() -> str:
+    counters = http_util.HTTP_COUNTERS
+    return '\'http_received\'={}B;;;{};; \'http_saved\'={}B;;;{};; \'http_not_modified\'={};;;{};{};'.format(
+        counters['received'], 0, counters['saved'], 0, counters['not_modified'], 0, counters['requests'])
+
+
+# Age of the cached number of active devices (message, perfdata)
+def active_age_output(age: float) -> (str, str):
+    if args.api_active_cache_ttl <= 0 :
+        return '', ''
+    return ' (active devices cache age: {}s)'.format(int(age)), ' \'active_devices_age\'={}s;;;{};;'.format(int(age), 0)
+
+
 # Command line parser
 args = parser.parse_args()
 
@@ -121,22 +149,20 @@ if args.command == 'active':
             message = 'API username and password required'
         )
     
-    success, result = api_util.core_api(
+    success, active_devices, active_age = api_util.active_devices(
         host = args.host,
-        request = 'devices/count?adminDeviceSpaceId=1&query="common.status"="ACTIVE"',
         username = args.api_username,
-        password = args.api_password
+        password = args.api_password,
+        port = args.api_port
     )
 
     if not success :
         service_output(
             title = 'ACTIVE DEVICES',
             exit_code = 3,
-            message = result
+            message = active_devices
         )
 
-    active_devices = int(json.loads(result)['totalCount'])
-
     warning_threshold = (args.warning if args.warning != None else 90)
     critical_threshold = (args.critical if args.critical != None else 100)
 
@@ -166,27 +192,27 @@ if args.command == 'non-compliant':
             message = 'API username and password required'
         )
     
-    success, result = api_util.core_api(
+    success, active_devices, active_age = api_util.active_devices(
         host = args.host,
-        request = 'devices/count?adminDeviceSpaceId=1&query="common.status"="ACTIVE"',
         username = args.api_username,
-        password = args.api_password
+        password = args.api_password,
+        port = args.api_port,
+        cache_ttl = args.api_active_cache_ttl
     )
 
     if not success :
         service_output(
             title = 'NON-COMPLIANT DEVICES',
             exit_code = 3,
-            message = result
+            message = active_devices
         )
 
-    active_devices = int(json.loads(result)['totalCount'])
-
     success, result = api_util.core_api(
         host = args.host,
         request = 'devices/count?adminDeviceSpaceId=1&query="common.status"="ACTIVE" AND "common.compliant" = false',
         username = args.api_username,
-        password = args.api_password
+        password = args.api_password,
+        port = args.api_port
     )
 
     nc_devices = int(json.loads(result)['totalCount'])
@@ -210,13 +236,13 @@ if args.command == 'non-compliant':
     service_output(
         title = 'NON-COMPLIANT DEVICES',
         exit_code = exit_code,
-        message = 'Number of Non-compliant devices : {} ({}%)'.format(nc_devices, int(nc_devices/active_devices*100)),
+        message = 'Number of Non-compliant devices : {} ({}%)'.format(nc_devices, int(nc_devices/active_devices*100)) + active_age_output(active_age)[0],
         perfdata = '\'devices\'={}devices;{};{};{};{};'.format(
             nc_devices,
             math.ceil(warning_threshold / 100 * active_devices),
             math.ceil(critical_threshold / 100 * active_devices),
             0,
-            args.maximum_devices)
+            args.maximum_devices) + active_age_output(active_age)[1]
     )
 
 if args.command == 'quarantined':
@@ -227,27 +253,27 @@ if args.command == 'quarantined':
             message = 'API username and password required'
         )
     
-    success, result = api_util.core_api(
+    success, active_devices, active_age = api_util.active_devices(
         host = args.host,
-        request = 'devices/count?adminDeviceSpaceId=1&query="common.status"="ACTIVE"',
         username = args.api_username,
-        password = args.api_password
+        password = args.api_password,
+        port = args.api_port,
+        cache_ttl = args.api_active_cache_ttl
     )
 
     if not success :
         service_output(
             title = 'QUARANTINED DEVICES',
             exit_code = 3,
-            message = result
+            message = active_devices
         )
 
-    active_devices = int(json.loads(result)['totalCount'])
-
     success, result = api_util.core_api(
         host = args.host,
         request = 'devices/count?adminDeviceSpaceId=1&query="common.status"="ACTIVE" AND "common.quarantined" = true',
         username = args.api_username,
-        password = args.api_password
+        password = args.api_password,
+        port = args.api_port
     )
 
     quarantined_devices = int(json.loads(result)['totalCount'])
@@ -271,13 +297,13 @@ if args.command == 'quarantined':
     service_output(
         title = 'QUARANTINED DEVICES',
         exit_code = exit_code,
-        message = 'Number of quarantined devices : {} ({}%)'.format(quarantined_devices, int(quarantined_devices/active_devices*100)),
+        message = 'Number of quarantined devices : {} ({}%)'.format(quarantined_devices, int(quarantined_devices/active_devices*100)) + active_age_output(active_age)[0],
         perfdata = '\'devices\'={}devices;{};{};{};{};'.format(
             quarantined_devices,
             math.ceil(warning_threshold / 100 * active_devices),
             math.ceil(critical_threshold / 100 * active_devices),
             0,
-            args.maximum_devices)
+            args.maximum_devices) + active_age_output(active_age)[1]
     )
 
 if args.command == 'filter':
@@ -295,27 +321,27 @@ if args.command == 'filter':
             message = 'Filter required'
         )
     
-    success, result = api_util.core_api(
+    success, active_devices, active_age = api_util.active_devices(
         host = args.host,
-        request = 'devices/count?adminDeviceSpaceId=1&query="common.status"="ACTIVE"',
         username = args.api_username,
-        password = args.api_password
+        password = args.api_password,
+        port = args.api_port,
+        cache_ttl = args.api_active_cache_ttl
     )
 
     if not success :
         service_output(
-            title = 'QUARANTINED DEVICES',
+            title = 'DEVICES',
             exit_code = 3,
-            message = result
+            message = active_devices
         )
 
-    active_devices = int(json.loads(result)['totalCount'])
-
     success, result = api_util.core_api(
         host = args.host,
         request = 'devices/count?adminDeviceSpaceId=1&query={}'.format(args.api_filter),
         username = args.api_username,
-        password = args.api_password
+        password = args.api_password,
+        port = args.api_port
     )
 
     devices = int(json.loads(result)['totalCount'])
@@ -339,13 +365,13 @@ if args.command == 'filter':
     service_output(
         title = 'DEVICES',
         exit_code = exit_code,
-        message = 'Number of devices : {} ({}%)'.format(devices, int(devices/active_devices*100)),
+        message = 'Number of devices : {} ({}%)'.format(devices, int(devices/active_devices*100)) + active_age_output(active_age)[0],
         perfdata = '\'devices\'={}devices;{};{};{};{};'.format(
             devices,
             math.ceil(warning_threshold / 100 * active_devices),
             math.ceil(critical_threshold / 100 * active_devices),
             0,
-            args.maximum_devices)
+            args.maximum_devices) + active_age_output(active_age)[1]
     )
 
 
@@ -27,6 +27,7 @@ import argparse
 import datetime
 import math
 import json
+import time
 import re
 from utils import cert_util, snmp_util, tcp_util, mics_util
 
@@ -46,8 +47,8 @@ parser.add_argument('host',
 parser.add_argument('command',
                     metavar='command', 
                     type=str,
-                    choices=['tcp_ping', 'certificate', 'storage', 'memory', 'cpu', 'uptime', 'logging', 'dns', 'ntp', 'devices'],
-                    help='Available commands: tcp_ping, certificate, storage, memory, cpu, uptime, logging, dns, ntp, devices')
+                    choices=['tcp_ping', 'tcp_sweep', 'certificate', 'certificates', 'storage', 'memory', 'cpu', 'uptime', 'system', 'logging', 'dns', 'ntp', 'devices', 'mics'],
+                    help='Available commands: tcp_ping, tcp_sweep, certificate, certificates, storage, memory, cpu, uptime, system, logging, dns, ntp, devices, mics')
 
 
 # General options
@@ -83,6 +84,12 @@ group_tcp.add_argument('--tcp-attempt',
                     default=20,
                     help='TCP sync attempt (default: 20)')
 
+group_tcp.add_argument('--tcp-concurrency',
+                    dest='tcp_concurrency',
+                    type=int,  
+                    default=None,
+                    help='Maximum TCP sync attempts in flight (default: all attempts at once)')
+
 group_tcp.add_argument('--tcp-failed-warning',
                     dest='tcp_failed_warning',
                     type=int,  
@@ -95,6 +102,41 @@ group_tcp.add_argument('--tcp-failed-critical',
                     default=100,
                     help='Critical threshold for failed attempt (default: 100)')
 
+group_tcp.add_argument('--tcp-threshold-on',
+                    dest='tcp_threshold_on',
+                    type=str,  
+                    default='avg',
+                    choices=['avg', 'min', 'max', 'p50', 'p95', 'p99', 'jitter'],
+                    help='Connect time statistic checked against thresholds (default: \'avg\')')
+
+group_tcp.add_argument('--tcp-family',
+                    dest='tcp_family',
+                    type=str,  
+                    default='ipv4',
+                    choices=['ipv4', 'ipv6', 'auto'],
+                    help='Address family, auto probes the fastest of IPv6/IPv4 (default: \'ipv4\')')
+
+group_tcp.add_argument('--tcp-targets',
+                    dest='tcp_targets',
+                    type=str,  
+                    default='',
+                    help='TCP sweep targets, comma separated host:port or port (default: host:<sentry-port>)')
+
+# Certificate
+group_status = parser.add_argument_group('Options for certificate check')
+
+group_status.add_argument('--certificate-cache-ttl',
+                    dest='certificate_cache_ttl',
+                    type=int,  
+                    default=3600,
+                    help='Seconds before checking the certificate again, 0 to disable cache (default: 3600)')
+
+group_status.add_argument('--certificate-timeout',
+                    dest='certificate_timeout',
+                    type=int,  
+                    default=10,
+                    help='Deadline in seconds for TLS connection and handshake (default: 10)')
+
 # SNMP check
 group_snmp = parser.add_argument_group('SNMP options')
 
@@ -110,6 +152,63 @@ group_snmp.add_argument('--snmp-version',
                     default=1,
                     help='SNMP version [0:v1, 1:v2] (default: \'v2\')')
 
+group_snmp.add_argument('--snmp-max-repetitions',
+                    dest='snmp_max_repetitions',
+                    type=int,  
+                    default=25,
+                    help='Rows per GETBULK request for table walks, v2 only, 0 to disable (default: 25)')
+
+group_snmp.add_argument('--snmp-storage-cache-ttl',
+                    dest='snmp_storage_cache_ttl',
+                    type=int,  
+                    default=3600,
+                    help='Seconds the storage index map is reused before walking hrStorageTable again, 0 to disable (default: 3600)')
+
+group_snmp.add_argument('--snmp-timeout',
+                    dest='snmp_timeout',
+                    type=float,  
+                    default=1,
+                    help='Maximum request timeout in seconds, shortened from the measured round trip time of the host (default: 1)')
+
+group_snmp.add_argument('--snmp-retries',
+                    dest='snmp_retries',
+                    type=int,  
+                    default=5,
+                    help='Request retries (default: 5)')
+
+group_snmp.add_argument('--snmp-hedge',
+                    dest='snmp_hedge',
+                    type=int,  
+                    default=0,
+                    help='Send a copy of late requests at half the timeout [0:disabled, 1:enabled] (default: 0)')
+
+group_snmp.add_argument('--system-thresholds',
+                    dest='system_thresholds',
+                    type=str,  
+                    default='',
+                    help='System command thresholds, check=warning:critical comma separated (default: \'storage=70:90,memory=90:100,cpu=90:100,uptime=183:365\')')
+
+# Passive checks
+group_passive = parser.add_argument_group('Passive check options')
+
+group_passive.add_argument('--passive-file',
+                    dest='passive_file',
+                    type=str,  
+                    default='',
+                    help='Monitoring engine command file where system and mics commands write one result per service (e.g. /var/lib/centreon-engine/rw/centengine.cmd)')
+
+group_passive.add_argument('--passive-host',
+                    dest='passive_host',
+                    type=str,  
+                    default='',
+                    help='Host name used for passive results (default: host)')
+
+group_passive.add_argument('--passive-services',
+                    dest='passive_services',
+                    type=str,  
+                    default='',
+                    help='Service descriptions of passive results, check=service comma separated, checks without description use the result title (e.g. \'storage=Storage,devices=Sentry utilization\')')
+
 # MICS
 group_mics = parser.add_argument_group('MICS options')
 
@@ -125,8 +224,50 @@ group_mics.add_argument('--mics-password',
                     default='',
                     help='MICS password')
 
+group_mics.add_argument('--mics-session-cache',
+                    dest='mics_session_cache',
+                    type=int,
+                    default=1,
+                    help='Reuse MICS session between checks, login only when expired [0:disabled, 1:enabled] (default: 1)')
 
-def service_output(title: str, exit_code: int, message: str, perfdata: str = None):
+group_mics.add_argument('--mics-checks',
+                    dest='mics_checks',
+                    type=str,
+                    default='logging,dns,ntp,devices',
+                    help='Mics command checks, comma separated (default: \'logging,dns,ntp,devices\')')
+
+group_mics.add_argument('--mics-thresholds',
+                    dest='mics_thresholds',
+                    type=str,
+                    default='',
+                    help='Mics command thresholds, check=warning:critical comma separated (default: \'logging=1:3,devices=80:100\')')
+
+group_mics.add_argument('--mics-concurrency',
+                    dest='mics_concurrency',
+                    type=int,
+                    default=4,
+                    help='Maximum concurrent MICS requests of mics command, 1 to send sequentially (default: 4)')
+
+group_mics.add_argument('--mics-diagnostic-cache-ttl',
+                    dest='mics_diagnostic_cache_ttl',
+                    type=int,
+                    default=300,
+                    help='Seconds a DNS/NTP diagnostic result is reused, older results are returned and refreshed in background, 0 to disable cache (default: 300)')
+
+group_mics.add_argument('--mics-diagnostic-max-age',
+                    dest='mics_diagnostic_max_age',
+                    type=int,
+                    default=3600,
+                    help='Maximum age in seconds of a DNS/NTP diagnostic result returned while refreshed in background (default: 3600)')
+
+group_mics.add_argument('--utilization-thresholds',
+                    dest='utilization_thresholds',
+                    type=str,
+                    default='',
+                    help='Devices check thresholds of other utilization counters, counter=warning:critical comma separated (e.g. \'active_sessions=500:800\')')
+
+
+def service_status(exit_code: int) -> str:
     status = 'UNKNOWN'
     if exit_code == 0:
         status = "OK"
@@ -134,27 +275,504 @@ def service_output(title: str, exit_code: int, message: str, perfdata: str = Non
         status = "WARNING"
     if exit_code == 2:
         status = "CRITICAL"
-    print("{} {} - {};{}".format(title, status, message, ('|'+perfdata if perfdata != None else '')))
+    return status
+
+
+def service_output(title: str, exit_code: int, message: str, perfdata: str = None):
+    print("{} {} - {};{}".format(title, service_status(exit_code), message, ('|'+perfdata if perfdata != None else '')))
     exit(exit_code)
 
 
+# Write check results to the monitoring engine command file (passive checks)
+# services: service description of each check (result title in lower case, spaces replaced by '_', e.g. core_status)
+def passive_output(command_file: str, host: str, results: [tuple], services: dict = {}):
+    with open(command_file, 'a') as f:
+        for service, exit_code, message, perfdata in results :
+            f.write('[{}] PROCESS_SERVICE_CHECK_RESULT;{};{};{};{} {} - {};{}\n'.format(
+                int(time.time()),
+                host,
+                services.get(service.lower().replace(' ', '_'), service),
+                exit_code,
+                service,
+                service_status(exit_code),
+                message,
+                ('|'+perfdata if perfdata != None else '')))
+
+
+# Threshold value (integer, or decimal if number is float)
+def threshold_number(value: str) -> float:
+    return (int(float(value)) if float(value).is_integer() else float(value))
+
+
+# Parse check=warning:critical comma separated thresholds, UNKNOWN output on invalid input
+# defaults: default thresholds of each check, other checks are rejected (None: any check, no default)
+# number: value parser (int or threshold_number)
+def parse_thresholds(title: str, option: str, value: str, defaults: dict = None, number = int) -> dict:
+    thresholds = dict(defaults if defaults != None else {})
+    for threshold in value.split(',') :
+        if threshold.strip() == '' :
+            continue
+        check, separator, values = threshold.partition('=')
+        check = check.strip()
+        try:
+            if separator == '' or check == '' :
+                raise ValueError()
+            warning, critical = [number(item) for item in values.split(':')]
+        except ValueError:
+            service_output(title, 3, 'Invalid {} \'{}\' (expected check=warning:critical)'.format(option, threshold.strip()))
+        if defaults != None and check not in defaults :
+            service_output(title, 3, 'Unknown check \'{}\' in {} (available: {})'.format(check, option, ', '.join(defaults)))
+        thresholds[check] = (warning, critical)
+    return thresholds
+
+
+# Parse --passive-services (check=service comma separated), UNKNOWN output on invalid input
+def passive_services(title: str) -> dict:
+    services = dict()
+    for mapping in args.passive_services.split(',') :
+        if mapping.strip() == '' :
+            continue
+        check, separator, service = mapping.partition('=')
+        if separator == '' or check.strip() == '' or service.strip() == '' :
+            service_output(title, 3, 'Invalid --passive-services \'{}\' (expected check=service)'.format(mapping.strip()))
+        services[check.strip().lower()] = service.strip()
+    return services
+
+
+# Output of several checks: one passive result per service (if enabled), worst state as plugin result
+# results: list of (service, exit_code, message, perfdata)
+# perfdata: additional perfdata (e.g. timings)
+def results_output(title: str, results: [tuple], perfdata: [str] = []):
+
+    # Per service results for passive checks
+    if args.passive_file != '' :
+        passive_output(args.passive_file, (args.passive_host if args.passive_host != '' else args.host), results, passive_services(title))
+
+    # WARNING/CRITICAL prevail over UNKNOWN, UNKNOWN over OK
+    exit_code = 0
+    for service, service_exit_code, service_message, service_perfdata in results :
+        if service_exit_code == 3 and exit_code == 0 :
+            exit_code = 3
+        elif service_exit_code in [1, 2] and (service_exit_code > exit_code or exit_code == 3) :
+            exit_code = service_exit_code
+
+    service_output(
+        title = title,
+        exit_code = exit_code,
+        message = ', '.join(['{} {}: {}'.format(service, service_status(service_exit_code), service_message) for service, service_exit_code, service_message, _ in results]),
+        perfdata = (' '.join([service_perfdata for _, _, _, service_perfdata in results if service_perfdata != None] + perfdata) or None)
+    )
+
+
+def timings_perfdata(timings: dict) -> str:
+    perfdata = ''
+    for timing in ['connect', 'handshake', 'ttfb', 'total'] :
+        if timing in timings :
+            perfdata += '\'{}\'={}ms;;;{};;'.format(timing, round(timings[timing], 1), 0)
+    return (perfdata if perfdata != '' else None)
+
+
+def snmp_perfdata(host: str) -> str:
+    stats = snmp_util.snmp_stats(host)
+    perfdata = '\'snmp_requests\'={};;;{};; \'snmp_retries\'={};;;{};;'.format(stats.requests, 0, stats.retries, 0)
+    if stats.rtt != None :
+        perfdata += ' \'snmp_rtt\'={}ms;;;{};;'.format(round(stats.rtt * 1000, 1), 0)
+    if stats.timeout != None :
+        perfdata += ' \'snmp_timeout\'={}ms;;;{};;'.format(round(stats.timeout * 1000, 1), 0)
+    return perfdata
+
+
+# Storage thresholds evaluation
+# storages: list of (hrStorageDescr, hrStorageAllocationUnits, hrStorageSize, hrStorageUsed)
+def storage_check(storages: [tuple], warning_threshold: int, critical_threshold: int) -> (int, str, str):
+
+    storage_table = dict()
+    for hrStorageDescr, hrStorageAllocationUnits, hrStorageSize, hrStorageUsed in storages :
+        
+        hrStorageSize = hrStorageSize * hrStorageAllocationUnits
+        hrStorageUsed = hrStorageUsed * hrStorageAllocationUnits
+        hrStorageUsedPercent = round(hrStorageUsed/hrStorageSize*100,1)
+
+        storage_table[hrStorageDescr] = {
+            'hrStorageDescr' : hrStorageDescr,
+            'hrStorageAllocationUnits' : hrStorageAllocationUnits,
+            'hrStorageSize' : hrStorageSize,
+            'hrStorageUsed' : hrStorageUsed,
+            'hrStorageUsedPercent' : hrStorageUsedPercent,
+        }
+
+    exit_code = 0
+    if storage_table['/']['hrStorageUsedPercent'] >= warning_threshold:
+        exit_code = 1
+    if storage_table['/']['hrStorageUsedPercent'] >= critical_threshold:
+        exit_code = 2
+
+    perfdata = '\'/\'={}B;{};{};{};{};'.format(
+            storage_table['/']['hrStorageUsed'],
+            round(warning_threshold*storage_table['/']['hrStorageSize']/100),
+            round(critical_threshold*storage_table['/']['hrStorageSize']/100),
+            0,
+            storage_table['/']['hrStorageSize'])
+
+    for hrStorageDescr in storage_table :
+        if hrStorageDescr.startswith('/') and hrStorageDescr != '/' :
+            perfdata += '\'{}\'={}B;{};{};{};{},'.format(
+                            hrStorageDescr,
+                            storage_table[hrStorageDescr]['hrStorageUsed'],
+                            '',
+                            '',
+                            0,
+                            storage_table[hrStorageDescr]['hrStorageSize'])
+
+    message = 'Used: {}/{}GB ({}%)'.format(round(storage_table['/']['hrStorageUsed'] * 10**-9,1), round(storage_table['/']['hrStorageSize'] * 10**-9,1), storage_table['/']['hrStorageUsedPercent'])
+
+    return exit_code, message, perfdata
+
+
+# Memory thresholds evaluation
+def memory_check(hrStorageAllocationUnits: int, hrStorageSize: int, hrStorageUsed: int, warning_threshold: int, critical_threshold: int) -> (int, str, str):
+
+    hrStorageSize = hrStorageSize * hrStorageAllocationUnits
+    hrStorageUsed = hrStorageUsed * hrStorageAllocationUnits
+    hrStorageUsedPercent = round(hrStorageUsed/hrStorageSize*100,1)
+
+    exit_code = 0
+    if hrStorageUsedPercent >= warning_threshold:
+        exit_code = 1
+    if hrStorageUsedPercent >= critical_threshold:
+        exit_code = 2
+
+    message = 'Used: {}/{}GB ({}%)'.format(round(hrStorageUsed * 10**-9,1), round(hrStorageSize * 10**-9,1), hrStorageUsedPercent)
+    perfdata = '\'memory\'={}B;{};{};{};{}'.format(
+            hrStorageUsed,
+            round(warning_threshold*hrStorageSize/100),
+            round(critical_threshold*hrStorageSize/100),
+            0,
+            hrStorageSize)
+
+    return exit_code, message, perfdata
+
+
+# CPU thresholds evaluation
+# loads: hrProcessorLoad of each CPU
+def cpu_check(loads: [int], warning_threshold: int, critical_threshold: int) -> (int, str, str):
+
+    avg_load=0
+    perfdata  = ''
+    index = 0
+    for load in loads:
+        avg_load += load
+        perfdata += '\'cpu{}\'={}%;{};{};{};{};'.format(
+            index,
+            load,
+            '',
+            '',
+            0,
+            100)
+        index += 1
+    avg_load = avg_load/len(loads)
+    perfdata  = '\'avg\'={}%;{};{};{};{};'.format(
+            int(avg_load),
+            round(warning_threshold),
+            round(critical_threshold),
+            0,
+            100) + perfdata
+
+    exit_code = 0
+    if avg_load >= warning_threshold:
+        exit_code = 1
+    if avg_load >= critical_threshold:
+        exit_code = 2
+
+    message = 'Load: {}% ({} CPUs)'.format(int(avg_load), len(loads))
+
+    return exit_code, message, perfdata
+
+
+# Uptime thresholds evaluation
+def uptime_check(hrSystemUptime_ticks: int, warning_threshold: int, critical_threshold: int) -> (int, str, str):
+
+    hrSystemUptime_datetime = datetime.timedelta(seconds = hrSystemUptime_ticks/100)
+
+    hrSystemUptime_days = hrSystemUptime_datetime.days
+    hrSystemUptime_hours = math.ceil(hrSystemUptime_datetime.seconds/3600)
+    hrSystemUptime_minutes = math.ceil((hrSystemUptime_datetime.seconds%3600)/60)
+
+    exit_code = 0
+    if hrSystemUptime_days >= warning_threshold:
+        exit_code = 1
+    if hrSystemUptime_days >= critical_threshold:
+        exit_code = 2
+
+    message = 'Uptime: {} days {} hours {} minutes'.format(hrSystemUptime_days, hrSystemUptime_hours, hrSystemUptime_minutes)
+    perfdata = '\'uptime\'={}days;{};{};{};{};'.format(
+            hrSystemUptime_days,
+            warning_threshold,
+            critical_threshold,
+            0,
+            400)
+
+    return exit_code, message, perfdata
+
+
+# MICS requests of each check
+MICS_QUERIES = {
+    'logging' : {
+        'method' : 'POST',
+        'uri' : '/mics/mics.html',
+        'data' : {
+            'action': 'getLogs',
+            'productType': 'Senry',
+            'command': 'getLogs'
+        }
+    },
+    'dns' : {
+        'method' : 'GET',
+        'uri' : '/mics/mics.html?_dc=1585503472800&servicename=DNS&action=testDiagnosticService&command=testDiagnosticService'
+    },
+    'ntp' : {
+        'method' : 'GET',
+        'uri' : '/mics/mics.html?_dc=1585509986551&servicename=NTP&action=testDiagnosticService&command=testDiagnosticService'
+    },
+    'devices' : {
+        'method' : 'GET',
+        'uri' : '/mics/mics.html?_dc=1585511343484&action=getSentryUtilization&command=getSentryUtilization'
+    }
+}
+
+
+# Active diagnostics run by the appliance on each request (several seconds), cached
+MICS_DIAGNOSTICS = ['dns', 'ntp']
+
+
+# Logging level evaluation
+# result: MICS getLogs response
+def logging_check(result: str, warning_threshold: int, critical_threshold: int) -> (int, str, str):
+
+    json_res = json.loads(result)
+    sentry_log_enabled = (True if re.search(r'"enable":"(\w+)"',json_res['asproxy']).group(1) == 'true' else False)
+    log_level = int(re.search(r'"verbosity":"level([0-9])"',json_res['asproxy']).group(1))
+ 
+    exit_code = 0
+    if sentry_log_enabled :
+        if log_level >= warning_threshold :
+            exit_code = 1
+        if log_level >= critical_threshold :
+            exit_code = 2
+
+    message = 'Sentry logging {} (level: {})'.format(('enabled' if sentry_log_enabled else 'disabled'), log_level)
+    perfdata = '\'log_level\'={},{},{},{},{}'.format(
+            log_level,
+            warning_threshold,
+            critical_threshold,
+            0,
+            4
+            )
+
+    return exit_code, message, perfdata
+
+
+# Diagnostic service (DNS, NTP) evaluation
+# result: MICS testDiagnosticService response
+# separator: replacement of line breaks in message
+# name: perfdata prefix
+# age: age in seconds of cached result (None: not cached)
+def diagnostic_check(result: str, separator: str = ' ', name: str = 'diagnostic', age: float = None) -> (int, str, str):
+
+    json_res = json.loads(result)
+
+    exit_code = 0
+    if json_res['results'][0]['status'] == 'Failed' :
+        exit_code = 2
+
+    message = json_res['results'][0]['message'].replace('&lt;br&gt;', separator)[:-1]
+
+    perfdata = None
+    if age != None :
+        message += ' (cache age: {}s)'.format(int(age))
+        perfdata = '\'{}_age\'={}s;;;{};;'.format(name, int(age), 0)
+
+    return exit_code, message, perfdata
+
+
+# Connected devices and utilization counters evaluation
+# result: MICS getSentryUtilization response
+# warning_threshold, critical_threshold: percentage of maximum devices (based on system scale)
+# counter_thresholds: {counter: (warning, critical)} absolute thresholds of other utilization counters
+def devices_check(result: str, warning_threshold: int, critical_threshold: int, counter_thresholds: dict = {}) -> (int, str, str):
+
+    try :
+        counters, attributes = mics_util.mics_utilization(result)
+    except (ValueError, AttributeError) as err :
+        return 3, 'Invalid utilization response ({})'.format(err), None
+
+    SYSTEM_SCALE_MAXIMUM = {
+        'Small'  : 2000,
+        'Medium' : 8000,
+        'Large'  : 20000
+    }
+
+    if 'number_of_connected_devices' not in counters :
+        return 3, 'Number of connected devices not found (available: {})'.format(', '.join(counters)), None
+
+    if 'system_scale' not in attributes :
+        return 3, 'System scale not found', None
+
+    if attributes['system_scale'] not in SYSTEM_SCALE_MAXIMUM :
+        return 3, 'Unknown system scale \'{}\''.format(attributes['system_scale']), None
+
+    connected_devices = int(counters['number_of_connected_devices'][0])
+
+    system_scale = attributes['system_scale']
+
+    system_scale_percent = connected_devices/SYSTEM_SCALE_MAXIMUM[system_scale]*100
+
+    exit_code = 0
+    if system_scale_percent >= warning_threshold:
+        exit_code = 1
+    if system_scale_percent >= critical_threshold:
+        exit_code = 2
+
+    message = 'Number of Connected Devices  : {} ({})'.format(connected_devices, system_scale)
+    perfdata = '\'devices\'={}devices;{};{};{};{};'.format(
+            connected_devices,
+            int(warning_threshold*SYSTEM_SCALE_MAXIMUM[system_scale]/100),
+            int(critical_threshold*SYSTEM_SCALE_MAXIMUM[system_scale]/100),
+            0,
+            SYSTEM_SCALE_MAXIMUM[system_scale])
+
+    # Every other counter of the payload
+    for counter, (value, unit) in counters.items() :
+        if counter == 'number_of_connected_devices' :
+            continue
+
+        value = (int(value) if value.is_integer() else value)
+        counter_warning, counter_critical = counter_thresholds.get(counter, ('', ''))
+
+        if counter in counter_thresholds :
+            counter_exit_code = 0
+            if value >= counter_warning:
+                counter_exit_code = 1
+            if value >= counter_critical:
+                counter_exit_code = 2
+            if counter_exit_code > 0 :
+                message += ', {} {}: {}{}'.format(counter, service_status(counter_exit_code), value, unit)
+            exit_code = max(exit_code, counter_exit_code)
+
+        perfdata += ' \'{}\'={}{};{};{};;;'.format(counter, value, unit, counter_warning, counter_critical)
+
+    # Thresholds of counters missing from the payload
+    for counter in counter_thresholds :
+        if counter not in counters :
+            if exit_code == 0 :
+                exit_code = 3
+            message += ', counter \'{}\' not found (available: {})'.format(counter, ', '.join(counters))
+
+    return exit_code, message, perfdata
+
+
 # Command line parser
 args = parser.parse_args()
 
+snmp_util.snmp_configure(args.snmp_timeout, args.snmp_retries, args.snmp_hedge == 1)
+
+# Utilization counters thresholds (warning:critical)
+utilization_thresholds = parse_thresholds(args.command.upper(), '--utilization-thresholds', args.utilization_thresholds, number = threshold_number)
+
 # TCP ping
 if args.command == 'tcp_ping':
     
-    success, time, passed, failed, error = tcp_util.tcp_ping(
+    success, stats, error = tcp_util.tcp_ping(
         host = args.host,
         port = args.sentry_port,
         timeout = 1,
-        packets = args.tcp_attempt
+        packets = args.tcp_attempt,
+        concurrency = args.tcp_concurrency,
+        family = args.tcp_family
     )
     
 
     if not success :
         service_output(
-        title = 'TCP PORT {}'.format(args.sentry_port),
+        title = 'TCP PORT {}'.format(args.sentry_port),
+        exit_code = 3, 
+        message = error
+    )
+
+    warning_threshold = (args.warning if args.warning != None else 1000)
+    critical_threshold =(args.critical if args.critical != None else 2000)
+
+    # Statistic checked against thresholds
+    time = stats.get(args.tcp_threshold_on)
+
+    exit_code = 0
+    if time >= warning_threshold :
+        exit_code = 1
+    if time >= critical_threshold :
+        exit_code = 2
+
+    failed_percent = int(stats.failed_percent)
+    if failed_percent >= args.tcp_failed_warning :
+        exit_code = 1
+    if failed_percent >= args.tcp_failed_critical :
+        exit_code = 2
+
+    message = 'time={}ms passed={} failed={}'.format(int(stats.avg), stats.passed, stats.failed)
+    if args.tcp_threshold_on != 'avg' :
+        message += ' {}={}ms'.format(args.tcp_threshold_on, int(time))
+
+    perfdata = '\'time\'={}ms;{};{};{};{};'.format(
+            int(stats.avg),
+            (warning_threshold if args.tcp_threshold_on == 'avg' else ''),
+            (critical_threshold if args.tcp_threshold_on == 'avg' else ''),
+            0,
+            int(critical_threshold*1.5)) 
+            
+    perfdata += '\'failed\'={}%;{};{};{};{};'.format(
+                failed_percent,
+                args.tcp_failed_warning,
+                args.tcp_failed_critical,
+                0,
+                100)
+
+    for statistic in ['min', 'max', 'p50', 'p95', 'p99', 'jitter'] :
+        perfdata += '\'{}\'={}ms;{};{};{};{};'.format(
+                statistic,
+                round(stats.get(statistic), 1),
+                (warning_threshold if args.tcp_threshold_on == statistic else ''),
+                (critical_threshold if args.tcp_threshold_on == statistic else ''),
+                0,
+                int(critical_threshold*1.5))
+
+    perfdata += '\'dns\'={}ms;;;{};;'.format(round(stats.dns, 1), 0)
+
+    service_output(
+        title = 'TCP PORT {}'.format(args.sentry_port),
+        exit_code = exit_code, 
+        message = message,
+        perfdata = perfdata
+    )
+
+###############################################################################################################
+
+# TCP sweep
+if args.command == 'tcp_sweep':
+
+    targets = tcp_util.parse_targets(args.tcp_targets, args.host, args.sentry_port)
+    if len(targets) == 0 :
+        targets = [(args.host, args.sentry_port)]
+
+    success, results, error = tcp_util.tcp_sweep(
+        targets = targets,
+        timeout = 1,
+        packets = args.tcp_attempt,
+        concurrency = args.tcp_concurrency,
+        family = args.tcp_family
+    )
+
+    if not success :
+        service_output(
+        title = 'TCP SWEEP',
         exit_code = 3, 
         message = error
     )
@@ -163,57 +781,85 @@ if args.command == 'tcp_ping':
     critical_threshold =(args.critical if args.critical != None else 2000)
 
     exit_code = 0
-    if time >= warning_threshold :
-        exit_code = 1
-    if time >= critical_threshold :
-        exit_code = 2
-
-    if failed > args.tcp_failed_warning :
-        exit_code = 1
-    if failed > args.tcp_failed_critical :
-        exit_code = 2
+    messages = []
+    perfdata = ''
+    for target in results :
+        target_success, stats, target_error = results[target]
 
-    service_output(
-        title = 'TCP PORT {}'.format(args.sentry_port),
-        exit_code = exit_code, 
-        message = 'time={}ms passed={} failed={}'.format(int(time), passed, failed ),
-        perfdata = '\'time\'={}ms;{};{};{};{};'.format(
-            int(time),
-            warning_threshold,
-            critical_threshold,
-            0,
-            int(critical_threshold*1.5)) 
-            
-            +
+        # Connection error (e.g. refused)
+        if not target_success :
+            exit_code = 2
+            messages.append('{} {}'.format(target, target_error))
+            continue
+
+        # Statistic checked against thresholds
+        time = stats.get(args.tcp_threshold_on)
+        failed_percent = int(stats.failed_percent)
+
+        target_exit_code = 0
+        if time >= warning_threshold or failed_percent >= args.tcp_failed_warning :
+            target_exit_code = 1
+        if time >= critical_threshold or failed_percent >= args.tcp_failed_critical :
+            target_exit_code = 2
+        exit_code = max(exit_code, target_exit_code)
+
+        if target_exit_code > 0 :
+            messages.append('{} {}={}ms failed={}'.format(target, args.tcp_threshold_on, int(time), stats.failed))
+
+        perfdata += '\'{}_{}\'={}ms;{};{};{};{};'.format(
+                target,
+                args.tcp_threshold_on,
+                round(time, 1),
+                warning_threshold,
+                critical_threshold,
+                0,
+                int(critical_threshold*1.5))
 
-            '\'failed\'={}%;{};{};{};{};'.format(
-                int(failed/(passed+failed)*100),
+        perfdata += '\'{}_failed\'={}%;{};{};{};{};'.format(
+                target,
+                failed_percent,
                 args.tcp_failed_warning,
                 args.tcp_failed_critical,
                 0,
                 100)
+
+        perfdata += '\'{}_dns\'={}ms;;;{};;'.format(target, round(stats.dns, 1), 0)
+
+    message = '{}/{} targets OK'.format(len(results) - len(messages), len(results))
+    if len(messages) > 0 :
+        message += ' ({})'.format(', '.join(messages))
+
+    service_output(
+        title = 'TCP SWEEP',
+        exit_code = exit_code, 
+        message = message,
+        perfdata = (perfdata if perfdata != '' else None)
     )
 
 ###############################################################################################################
 
 # SSL check
 if args.command == 'certificate':
+
+    warning_threshold = (args.warning if args.warning != None else 60)
+    critical_threshold =(args.critical if args.critical != None else 30)
     
-    success, remaining_days, message = cert_util.check_cert(
+    success, remaining_days, message, timings = cert_util.check_cert(
         host = args.host,
-        port = args.sentry_port
+        port = args.sentry_port,
+        cache_ttl = args.certificate_cache_ttl,
+        revalidate_days = warning_threshold,
+        timeout = args.certificate_timeout
     )
     
     if not success :
         service_output(
         title = 'CERTIFICATE PORT {}'.format(args.sentry_port),
         exit_code = 3, 
-        message = message
+        message = message,
+        perfdata = timings_perfdata(timings)
     )
 
-    warning_threshold = (args.warning if args.warning != None else 60)
-    critical_threshold =(args.critical if args.critical != None else 30)
-
     exit_code = 0
     if remaining_days < warning_threshold :
         exit_code = 1
@@ -223,7 +869,65 @@ if args.command == 'certificate':
     service_output(
         title = 'CERTIFICATE PORT {}'.format(args.sentry_port),
         exit_code = exit_code, 
-        message = message
+        message = message,
+        perfdata = timings_perfdata(timings)
+    )
+
+###############################################################################################################
+
+# Certificates inventory (all ports, full chain)
+if args.command == 'certificates':
+
+    CERTIFICATE_PORTS = {
+        'port_443' : 443,
+        'port_8443' : 8443,
+    }
+
+    warning_threshold = (args.warning if args.warning != None else 60)
+    critical_threshold =(args.critical if args.critical != None else 30)
+
+    results = cert_util.check_chains(
+        targets = [(args.host, port) for port in CERTIFICATE_PORTS.values()],
+        timeout = args.certificate_timeout
+    )
+
+    exit_code = 0
+    unknown = False
+    messages = []
+    perfdata = ''
+    for name in CERTIFICATE_PORTS :
+        success, chain, message = results['{}:{}'.format(args.host, CERTIFICATE_PORTS[name])]
+
+        if not success :
+            unknown = True
+            messages.append('{}: {}'.format(name, message))
+            continue
+
+        # Soonest expiration of the presented chain (intermediates included)
+        subject, remaining_days = min(chain, key=lambda cert: cert[1])
+
+        if remaining_days < warning_threshold and exit_code < 1 :
+            exit_code = 1
+        if remaining_days < critical_threshold :
+            exit_code = 2
+
+        messages.append('{}: {} days ({}, {} certificates)'.format(name, remaining_days, subject, len(chain)))
+        perfdata += '\'{}\'={}days;{};{};{};{};'.format(
+            name,
+            remaining_days,
+            warning_threshold,
+            critical_threshold,
+            0,
+            '')
+
+    if unknown and exit_code == 0 :
+        exit_code = 3
+
+    service_output(
+        title = 'CERTIFICATES',
+        exit_code = exit_code,
+        message = ', '.join(messages),
+        perfdata = (perfdata if perfdata != '' else None)
     )
 
 ###############################################################################################################   
@@ -238,7 +942,7 @@ if args.command == 'storage':
     hrStorageSize_OID = prefix + '1.5'
     hrStorageUsed_OID = prefix + '1.6'
 
-    success, result, message = snmp_util.snmp_table(
+    success, result, message = snmp_util.snmp_storage_table(
         host = args.host,
         oids = [
             hrStorageDescr_OID,
@@ -247,7 +951,9 @@ if args.command == 'storage':
             hrStorageUsed_OID
         ],
         version = args.snmp_version,
-        community = args.snmp_community
+        community = args.snmp_community,
+        max_repetitions = args.snmp_max_repetitions,
+        cache_ttl = args.snmp_storage_cache_ttl
     )
   
     if not success :
@@ -257,58 +963,20 @@ if args.command == 'storage':
             message = message
         )
 
-
-    storage_table = dict()
-    for storage in result :
-        
-        hrStorageDescr = storage[hrStorageDescr_OID]
-        hrStorageAllocationUnits = int(int(storage[hrStorageAllocationUnits_OID]))
-        hrStorageSize = int(storage[hrStorageSize_OID]) * hrStorageAllocationUnits
-        hrStorageUsed = int(storage[hrStorageUsed_OID]) * hrStorageAllocationUnits
-        hrStorageUsedPercent = round(hrStorageUsed/hrStorageSize*100,1)
-
-        storage_table[hrStorageDescr] = {
-            'hrStorageDescr' : hrStorageDescr,
-            'hrStorageAllocationUnits' : hrStorageAllocationUnits,
-            'hrStorageSize' : hrStorageSize,
-            'hrStorageUsed' : hrStorageUsed,
-            'hrStorageUsedPercent' : hrStorageUsedPercent,
-        }
-
-        
-
     warning_threshold = (args.warning if args.warning != None else 70)
     critical_threshold = (args.critical if args.critical != None else 90)
-    exit_code = 0
-    if storage_table['/']['hrStorageUsedPercent'] >= warning_threshold:
-        exit_code = 1
-    if storage_table['/']['hrStorageUsedPercent'] >= critical_threshold:
-        exit_code = 2
-
-
 
-    perfdata = '\'/\'={}B;{};{};{};{};'.format(
-            storage_table['/']['hrStorageUsed'],
-            round(warning_threshold*storage_table['/']['hrStorageSize']/100),
-            round(critical_threshold*storage_table['/']['hrStorageSize']/100),
-            0,
-            storage_table['/']['hrStorageSize'])
-
-    for hrStorageDescr in storage_table :
-        if hrStorageDescr.startswith('/') and hrStorageDescr != '/' :
-            perfdata += '\'{}\'={}B;{};{};{};{},'.format(
-                            hrStorageDescr,
-                            storage_table[hrStorageDescr]['hrStorageUsed'],
-                            '',
-                            '',
-                            0,
-                            storage_table[hrStorageDescr]['hrStorageSize'])
+    exit_code, message, perfdata = storage_check(
+        [(storage[hrStorageDescr_OID], storage[hrStorageAllocationUnits_OID], storage[hrStorageSize_OID], storage[hrStorageUsed_OID]) for storage in result],
+        warning_threshold,
+        critical_threshold
+    )
     
     service_output(
         title = 'STORAGE',
         exit_code = exit_code,
-        message = 'Used: {}/{}GB ({}%)'.format(round(storage_table['/']['hrStorageUsed'] * 10**-9,1), round(storage_table['/']['hrStorageSize'] * 10**-9,1), storage_table['/']['hrStorageUsedPercent']),
-        perfdata = perfdata
+        message = message,
+        perfdata = perfdata + ' ' + snmp_perfdata(args.host)
     )
 
 ###############################################################################################################
@@ -340,30 +1008,22 @@ if args.command == 'memory':
             message = message
         )
 
-    hrStorageAllocationUnits = int(result[hrStorageAllocationUnits_OID])
-    hrStorageSize = int(result[hrStorageSize_OID]) * hrStorageAllocationUnits
-    hrStorageUsed = int(result[hrStorageUsed_OID]) * hrStorageAllocationUnits
-    hrStorageUsedPercent = round(hrStorageUsed/hrStorageSize*100,1)
-
     warning_threshold = (args.warning if args.warning != None else 90)
     critical_threshold = (args.critical if args.critical != None else 100)
 
-    exit_code = 0
-    if hrStorageUsedPercent >= warning_threshold:
-        exit_code = 1
-    if hrStorageUsedPercent >= critical_threshold:
-        exit_code = 2
+    exit_code, message, perfdata = memory_check(
+        int(result[hrStorageAllocationUnits_OID]),
+        int(result[hrStorageSize_OID]),
+        int(result[hrStorageUsed_OID]),
+        warning_threshold,
+        critical_threshold
+    )
     
     service_output(
         title = 'MEMORY',
         exit_code = exit_code,
-        message = 'Used: {}/{}GB ({}%)'.format(round(hrStorageUsed * 10**-9,1), round(hrStorageSize * 10**-9,1), hrStorageUsedPercent),
-        perfdata = '\'memory\'={}B;{};{};{};{}'.format(
-            hrStorageUsed,
-            round(warning_threshold*hrStorageSize/100),
-            round(critical_threshold*hrStorageSize/100),
-            0,
-            hrStorageSize)
+        message = message,
+        perfdata = perfdata + ' ' + snmp_perfdata(args.host)
     )
 
 ###############################################################################################################
@@ -384,7 +1044,8 @@ if args.command == 'cpu':
             hrProcessorLoad_OID,
         ],
         version = args.snmp_version,
-        community = args.snmp_community
+        community = args.snmp_community,
+        max_repetitions = args.snmp_max_repetitions
     )
 
     if not success :
@@ -396,42 +1057,18 @@ if args.command == 'cpu':
 
     warning_threshold = (args.warning if args.warning != None else 90)
     critical_threshold = (args.critical if args.critical != None else 100)
-  
-    avg_load=0
-    perfdata  = ''
-    index=0
-    for cpu in result:
-        avg_load += int(cpu[hrProcessorLoad_OID])
-        perfdata += '\'cpu{}\'={}%;{};{};{};{};'.format(
-            index,
-            cpu[hrProcessorLoad_OID],
-            '',
-            '',
-            0,
-            100)
-        index += 1
-    avg_load = avg_load/len(result)
-
-    perfdata  = '\'avg\'={}%;{};{};{};{};'.format(
-            int(avg_load),
-            round(warning_threshold),
-            round(critical_threshold),
-            0,
-            100) + perfdata
-
 
-
-    exit_code = 0
-    if avg_load >= warning_threshold:
-        exit_code = 1
-    if avg_load >= critical_threshold:
-        exit_code = 2
+    exit_code, message, perfdata = cpu_check(
+        result.column(hrProcessorLoad_OID),
+        warning_threshold,
+        critical_threshold
+    )
     
     service_output(
         title = 'CPU',
         exit_code = exit_code,
-        message = 'Load: {}% ({} CPUs)'.format(int(avg_load), len(result)),
-        perfdata = perfdata
+        message = message,
+        perfdata = perfdata + ' ' + snmp_perfdata(args.host)
     )
 
 ###############################################################################################################
@@ -457,37 +1094,105 @@ if args.command == 'uptime':
             message = message
         )
 
-    hrProcessorFrwID_index = 0
-    hrProcessorLoad_index = 1
-    
-    hrSystemUptime_ticks = int(result[hrSystemUptime_OID])
-    hrSystemUptime_datetime = datetime.timedelta(seconds = hrSystemUptime_ticks/100)
-
-    hrSystemUptime_days = hrSystemUptime_datetime.days
-    hrSystemUptime_hours = math.ceil(hrSystemUptime_datetime.seconds/3600)
-    hrSystemUptime_minutes = math.ceil((hrSystemUptime_datetime.seconds%3600)/60)
-
     warning_threshold = (args.warning if args.warning != None else 183)
     critical_threshold = (args.critical if args.critical != None else 365)
 
-    exit_code = 0
-    if hrSystemUptime_days >= warning_threshold:
-        exit_code = 1
-    if hrSystemUptime_days >= critical_threshold:
-        exit_code = 2
+    exit_code, message, perfdata = uptime_check(
+        int(result[hrSystemUptime_OID]),
+        warning_threshold,
+        critical_threshold
+    )
     
     service_output(
         title = 'UPTIME',
         exit_code = exit_code,
-        message = 'Uptime: {} days {} hours {} minutes'.format(hrSystemUptime_days, hrSystemUptime_hours, hrSystemUptime_minutes),
-        perfdata = '\'uptime\'={}days;{};{};{};{};'.format(
-            hrSystemUptime_days,
-            warning_threshold,
-            critical_threshold,
-            0,
-            400)
+        message = message,
+        perfdata = perfdata + ' ' + snmp_perfdata(args.host)
+    )
+
+###############################################################################################################
+
+# System check (storage, memory, CPU and uptime in one SNMP exchange)
+if args.command == 'system':
+
+    prefix = 'iso.org.dod.internet.mgmt.mib-2.25.'
+
+    hrStorageDescr_OID = prefix + '2.3.1.3'
+    hrStorageAllocationUnits_OID = prefix + '2.3.1.4'
+    hrStorageSize_OID = prefix + '2.3.1.5'
+    hrStorageUsed_OID = prefix + '2.3.1.6'
+    hrProcessorLoad_OID = prefix + '3.3.1.2'
+    hrSystemUptime_OID = prefix + '1.1'
+
+    # Thresholds (warning:critical) of each check
+    thresholds = parse_thresholds('SYSTEM', '--system-thresholds', args.system_thresholds, {
+        'storage' : (70, 90),
+        'memory' : (90, 100),
+        'cpu' : (90, 100),
+        'uptime' : (183, 365),
+    })
+
+    success, result, message = snmp_util.snmp_walk(
+        host = args.host,
+        oids = [
+            hrStorageDescr_OID,
+            hrStorageAllocationUnits_OID,
+            hrStorageSize_OID,
+            hrStorageUsed_OID,
+            hrProcessorLoad_OID,
+            hrSystemUptime_OID
+        ],
+        version = args.snmp_version,
+        community = args.snmp_community,
+        max_repetitions = args.snmp_max_repetitions
     )
 
+    if not success :
+        service_output(
+            title = 'SYSTEM',
+            exit_code = 3,
+            message = message
+        )
+
+    storage_indexes = result[hrStorageDescr_OID]
+    results = []
+    try:
+        results.append(('STORAGE',) + storage_check(
+            [(result[hrStorageDescr_OID][index], int(result[hrStorageAllocationUnits_OID][index]), int(result[hrStorageSize_OID][index]), int(result[hrStorageUsed_OID][index])) for index in storage_indexes],
+            *thresholds['storage']
+        ))
+    except BaseException as err:
+        results.append(('STORAGE', 3, format(err), None))
+
+    # Memory is hrStorageTable index 1
+    try:
+        results.append(('MEMORY',) + memory_check(
+            int(result[hrStorageAllocationUnits_OID][1]),
+            int(result[hrStorageSize_OID][1]),
+            int(result[hrStorageUsed_OID][1]),
+            *thresholds['memory']
+        ))
+    except BaseException as err:
+        results.append(('MEMORY', 3, format(err), None))
+
+    try:
+        results.append(('CPU',) + cpu_check(
+            [int(load) for load in result[hrProcessorLoad_OID].values()],
+            *thresholds['cpu']
+        ))
+    except BaseException as err:
+        results.append(('CPU', 3, format(err), None))
+
+    try:
+        results.append(('UPTIME',) + uptime_check(
+            int(result[hrSystemUptime_OID][0]),
+            *thresholds['uptime']
+        ))
+    except BaseException as err:
+        results.append(('UPTIME', 3, format(err), None))
+
+    results_output('SYSTEM', results, [snmp_perfdata(args.host)])
+
 ###############################################################################################################
 
 # Logging level check
@@ -503,14 +1208,9 @@ if args.command == 'logging':
         host= args.host,
         username = args.mics_username,
         password = args.mics_password,
-        method = 'POST',
-        uri = '/mics/mics.html',
-        data = {
-            'action': 'getLogs',
-            'productType': 'Senry',
-            'command': 'getLogs'
-        },
-        port= 8443
+        port= 8443,
+        session_cache = args.mics_session_cache == 1,
+        **MICS_QUERIES['logging']
     )
 
     if not success :
@@ -523,30 +1223,13 @@ if args.command == 'logging':
     warning_threshold = (args.warning if args.warning != None else 1)
     critical_threshold = (args.critical if args.critical != None else 3)
 
-
-    json_res = json.loads(result)
-    sentry_log_enabled = (True if re.search(r'"enable":"(\w+)"',json_res['asproxy']).group(1) == 'true' else False)
-    log_level = int(re.search(r'"verbosity":"level([0-9])"',json_res['asproxy']).group(1))
- 
-    exit_code = 0
-    if sentry_log_enabled :
-        if log_level >= warning_threshold :
-            exit_code = 1
-        if log_level >= critical_threshold :
-            exit_code = 2
-    
+    exit_code, message, perfdata = logging_check(result, warning_threshold, critical_threshold)
 
     service_output(
         title = 'LOGGING',
         exit_code = exit_code,
-        message = 'Sentry logging {} (level: {})'.format(('enabled' if sentry_log_enabled else 'disabled'), log_level),
-        perfdata = '\'log_level\'={},{},{},{},{}'.format(
-            log_level,
-            warning_threshold,
-            critical_threshold,
-            0,
-            4
-            )
+        message = message,
+        perfdata = perfdata
     )
 
 ###############################################################################################################
@@ -560,13 +1243,15 @@ if args.command == 'dns':
             message = 'MICS password required'
         )
     
-    success, result = mics_util.mics_info(
+    success, result, age = mics_util.mics_diagnostic(
         host= args.host,
         username = args.mics_username,
         password = args.mics_password,
-        method = 'GET',
-        uri = '/mics/mics.html?_dc=1585503472800&servicename=DNS&action=testDiagnosticService&command=testDiagnosticService',
-        port= 8443
+        port= 8443,
+        session_cache = args.mics_session_cache == 1,
+        cache_ttl = args.mics_diagnostic_cache_ttl,
+        cache_max_age = args.mics_diagnostic_max_age,
+        **MICS_QUERIES['dns']
     )
 
     if not success :
@@ -576,16 +1261,13 @@ if args.command == 'dns':
             message = result
         )
 
-    json_res = json.loads(result)
-
-    exit_code = 0
-    if json_res['results'][0]['status'] == 'Failed' :
-        exit_code = 2
+    exit_code, message, perfdata = diagnostic_check(result, '', 'dns', (age if args.mics_diagnostic_cache_ttl > 0 else None))
     
     service_output(
         title = 'DNS',
         exit_code = exit_code,
-        message = json_res['results'][0]['message'].replace('&lt;br&gt;', '')[:-1],
+        message = message,
+        perfdata = perfdata
     )
 
 ###############################################################################################################
@@ -599,13 +1281,15 @@ if args.command == 'ntp':
             message = 'MICS password required'
         )
     
-    success, result = mics_util.mics_info(
+    success, result, age = mics_util.mics_diagnostic(
         host= args.host,
         username = args.mics_username,
         password = args.mics_password,
-        method = 'GET',
-        uri = '/mics/mics.html?_dc=1585509986551&servicename=NTP&action=testDiagnosticService&command=testDiagnosticService',
-        port= 8443
+        port= 8443,
+        session_cache = args.mics_session_cache == 1,
+        cache_ttl = args.mics_diagnostic_cache_ttl,
+        cache_max_age = args.mics_diagnostic_max_age,
+        **MICS_QUERIES['ntp']
     )
 
     if not success :
@@ -615,16 +1299,13 @@ if args.command == 'ntp':
             message = result
         )
 
-    json_res = json.loads(result)
-
-    exit_code = 0
-    if json_res['results'][0]['status'] == 'Failed' :
-        exit_code = 2
+    exit_code, message, perfdata = diagnostic_check(result, ' ', 'ntp', (age if args.mics_diagnostic_cache_ttl > 0 else None))
     
     service_output(
         title = 'NTP',
         exit_code = exit_code,
-        message = json_res['results'][0]['message'].replace('&lt;br&gt;', ' ')[:-1],
+        message = message,
+        perfdata = perfdata
     )
     
 
@@ -643,9 +1324,9 @@ if args.command == 'devices':
         host= args.host,
         username = args.mics_username,
         password = args.mics_password,
-        method = 'GET',
-        uri = '/mics/mics.html?_dc=1585511343484&action=getSentryUtilization&command=getSentryUtilization',
-        port= 8443
+        port= 8443,
+        session_cache = args.mics_session_cache == 1,
+        **MICS_QUERIES['devices']
     )
 
     if not success :
@@ -655,38 +1336,88 @@ if args.command == 'devices':
             message = result
         )
 
-    json_res = json.loads(result)
-
-    connected_devices = int(re.search(r'Number of Connected Devices  : ([0-9]+)', json_res['utilization']).group(1))
-
-    system_scale = re.search(r'SYSTEM_SCALE=(\w+)', json_res['systemScale']).group(1)
-
-    SYSTEM_SCALE_MAXIMUM = {
-        'Small'  : 2000,
-        'Medium' : 8000,
-        'Large'  : 20000
-    }
-
-    system_scale_percent = connected_devices/SYSTEM_SCALE_MAXIMUM[system_scale]*100
-
-
     warning_threshold = (args.warning if args.warning != None else 80)
     critical_threshold = (args.critical if args.critical != None else 100)
-    
-    exit_code = 0
-    if system_scale_percent >= warning_threshold:
-        exit_code = 1
-    if system_scale_percent >= critical_threshold:
-        exit_code = 2
+
+    exit_code, message, perfdata = devices_check(result, warning_threshold, critical_threshold, utilization_thresholds)
     
     service_output(
         title = 'DEVICES',
         exit_code = exit_code,
-        message = 'Number of Connected Devices  : {} ({})'.format(connected_devices, system_scale),
-        perfdata = '\'devices\'={}devices;{};{};{};{};'.format(
-            connected_devices,
-            int(warning_threshold*SYSTEM_SCALE_MAXIMUM[system_scale]/100),
-            int(critical_threshold*SYSTEM_SCALE_MAXIMUM[system_scale]/100),
-            0,
-            SYSTEM_SCALE_MAXIMUM[system_scale])
+        message = message,
+        perfdata = perfdata
     )
+
+###############################################################################################################
+
+# MICS checks bundle (one login, all requests over the same session)
+if args.command == 'mics':
+    if args.mics_password == '' :
+        service_output(
+            title = 'MICS',
+            exit_code = 3,
+            message = 'MICS password required'
+        )
+
+    checks = [check.strip() for check in args.mics_checks.split(',') if check.strip() != '']
+    for check in checks :
+        if check not in MICS_QUERIES :
+            service_output(
+                title = 'MICS',
+                exit_code = 3,
+                message = 'Unknown check \'{}\' (available: {})'.format(check, ', '.join(MICS_QUERIES))
+            )
+
+    # Thresholds (warning:critical) of each check
+    thresholds = parse_thresholds('MICS', '--mics-thresholds', args.mics_thresholds, {
+        'logging' : (1, 3),
+        'devices' : (80, 100),
+    })
+
+    # Active diagnostics are cached and refreshed in background, other checks are live
+    diagnostics = [check for check in checks if check in MICS_DIAGNOSTICS and args.mics_diagnostic_cache_ttl > 0]
+    outputs = dict()
+    for group, cache_ttl in [([check for check in checks if check not in diagnostics], 0), (diagnostics, args.mics_diagnostic_cache_ttl)] :
+        if len(group) == 0 :
+            continue
+
+        success, result, message = mics_util.mics_queries(
+            host= args.host,
+            username = args.mics_username,
+            password = args.mics_password,
+            queries = [MICS_QUERIES[check] for check in group],
+            port= 8443,
+            session_cache = args.mics_session_cache == 1,
+            concurrency = args.mics_concurrency,
+            cache_ttl = cache_ttl,
+            cache_max_age = args.mics_diagnostic_max_age
+        )
+
+        if not success :
+            service_output(
+                title = 'MICS',
+                exit_code = 3,
+                message = message
+            )
+
+        outputs.update(zip(group, result))
+
+    results = []
+    for check in checks :
+        check_success, check_result, check_age = outputs[check]
+        if not check_success :
+            results.append((check.upper(), 3, check_result, None))
+            continue
+        try:
+            if check == 'logging' :
+                results.append(('LOGGING',) + logging_check(check_result, *thresholds['logging']))
+            if check == 'dns' :
+                results.append(('DNS',) + diagnostic_check(check_result, '', 'dns', (check_age if check in diagnostics else None)))
+            if check == 'ntp' :
+                results.append(('NTP',) + diagnostic_check(check_result, ' ', 'ntp', (check_age if check in diagnostics else None)))
+            if check == 'devices' :
+                results.append(('DEVICES',) + devices_check(check_result, *thresholds['devices'], utilization_thresholds))
+        except BaseException as err:
+            results.append((check.upper(), 3, format(err), None))
+
+    results_output('MICS', results)
@@ -0,0 +1,41 @@
+###############################################################################################################
+# Language     :  Python (3.7)
+# Filename     :  test_mics_util.py
+# Autor        :  https://github.com/nosari20
+# Description  :  Sentry utilization parser tests (fixtures/sentry_utilization.json)
+# Repository   :  https://github.com/nosari20/centreon-mobileiron-plugin
+###############################################################################################################
+#
+# Usage: python3 -m pytest tests
+#
+###############################################################################################################
+
+import os
+import sys
+import json
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import mics_util
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'sentry_utilization.json'), 'r') as f :
+    FIXTURES = json.load(f)
+
+
+@pytest.mark.parametrize('fixture', FIXTURES, ids=[fixture['name'] for fixture in FIXTURES])
+def test_mics_utilization(fixture: dict) :
+
+    counters, attributes = mics_util.mics_utilization(json.dumps(fixture['response']))
+
+    for name, (value, unit) in fixture['counters'].items() :
+        assert counters[name] == (value, unit)
+    for name, value in fixture['attributes'].items() :
+        assert attributes[name] == value
+    for name in fixture['missing'] :
+        assert name not in counters and name not in attributes
+
+
+def test_mics_utilization_invalid() :
+    with pytest.raises(ValueError) :
+        mics_util.mics_utilization('<html>')
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+###############################################################################################################
+# Language     :  Python (3.x)
+# Filename     :  bench_snmp_oids.py
+# Autor        :  https://github.com/nosari20
+# Description  :  Benchmark of numeric OIDs without MIB lookup against symbolic OIDs resolved by pysnmp
+# Repository   :  https://github.com/nosari20/centreon-mobileiron-plugin
+###############################################################################################################
+#
+# Usage: sudo ./tools/bench_snmp_oids.py [--runs 3] [--cycles 20] [--host 127.0.0.2]
+#
+# Each mode runs in a fresh process (import and first cycle include MIB loading). A cycle is a storage
+# table, a memory get, a cpu table, an uptime get and a walk of the system subtrees.
+# "symbolic" sends symbolic ObjectIdentity with MIB lookup of responses (behaviour before SNMP_OIDS),
+# "numeric" uses snmp_util (numeric tuples, lookupMib=False).
+#
+### Changelog ###
+#
+# ~~ Version 0.1 ~~
+#
+#
+###############################################################################################################
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEMORY = ['iso.org.dod.internet.mgmt.mib-2.25.2.3.1.4.1', 'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.5.1', 'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.6.1']
+UPTIME = ['iso.org.dod.internet.mgmt.mib-2.25.1.1.0']
+STORAGE = ['iso.org.dod.internet.mgmt.mib-2.25.2.3.1.3', 'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.4', 'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.5', 'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.6']
+CPU = ['iso.org.dod.internet.mgmt.mib-2.25.3.3.1.2']
+SYSTEM = ['iso.org.dod.internet.mgmt.mib-2.25.1.1', 'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.3', 'iso.org.dod.internet.mgmt.mib-2.25.3.3.1.2']
+
+#
+# Child process: one mode, prints import, first cycle and warm cycle times (ms) as JSON
+#
+def child(mode: str, host: str, cycles: int) :
+
+    os.environ['MI_PLUGIN_CACHE_DIR'] = tempfile.mkdtemp()
+    sys.path.insert(0, ROOT)
+
+    t0 = time.perf_counter()
+    from utils import snmp_util
+    from pysnmp.hlapi import ObjectType, ObjectIdentity, getCmd, bulkCmd
+    t1 = time.perf_counter()
+
+    from tools.snmp_agent import SnmpAgent
+    SnmpAgent(host)
+
+    # Symbolic requests, responses resolved against the MIB (str values like snmp_util)
+    def symbolic_get(oids) :
+        engine, community, transport, context = snmp_util.snmp_session(host)
+        errorIndication, errorStatus, errorIndex, varBinds = next(getCmd(engine, community, transport, context, *[ObjectType(ObjectIdentity(oid)) for oid in oids]))
+        return {oid: str(varBind[1]) for oid, varBind in zip(oids, varBinds)}
+
+    def symbolic_table(oids) :
+        engine, community, transport, context = snmp_util.snmp_session(host)
+        rows = []
+        for errorIndication, errorStatus, errorIndex, varBinds in bulkCmd(engine, community, transport, context, 0, 25, *[ObjectType(ObjectIdentity(oid)) for oid in oids], lexicographicMode=False) :
+            rows.append({oid: str(varBind[1]) for oid, varBind in zip(oids, varBinds)})
+        return rows
+
+    def cycle() :
+        if mode == 'symbolic' :
+            symbolic_table(STORAGE)
+            symbolic_get(MEMORY)
+            symbolic_table(CPU)
+            symbolic_get(UPTIME)
+            symbolic_table(SYSTEM)
+        else :
+            snmp_util.snmp_table(host, STORAGE)
+            snmp_util.snmp_get(host, MEMORY)
+            snmp_util.snmp_table(host, CPU)
+            snmp_util.snmp_get(host, UPTIME)
+            snmp_util.snmp_walk(host, SYSTEM)
+
+    t2 = time.perf_counter()
+    cycle()
+    t3 = time.perf_counter()
+    for _ in range(cycles) :
+        cycle()
+    t4 = time.perf_counter()
+
+    print(json.dumps({'import' : (t1-t0)*1000, 'first' : (t3-t2)*1000, 'warm' : (t4-t3)*1000/cycles}))
+
+
+parser = argparse.ArgumentParser(description='Numeric OIDs benchmark')
+parser.add_argument('--runs', dest='runs', type=int, default=3, help='Processes per mode (default: 3)')
+parser.add_argument('--cycles', dest='cycles', type=int, default=20, help='Warm cycles per process (default: 20)')
+parser.add_argument('--host', dest='host', type=str, default='127.0.0.2', help='Agent address (default: 127.0.0.2)')
+parser.add_argument('--child', dest='child', type=str, default=None, help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+if args.child != None :
+    child(args.child, args.host, args.cycles)
+    sys.exit(0)
+
+print('{:<10} {:>20} {:>20} {:>20}'.format('mode', 'import (ms)', 'first cycle (ms)', 'warm cycle (ms)'))
+for mode in ['symbolic', 'numeric'] :
+    runs = []
+    for _ in range(args.runs) :
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, '--host', args.host, '--cycles', str(args.cycles)], capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output))
+    print('{:<10} {:>20} {:>20} {:>20}'.format(mode, *['{:.0f}-{:.0f}'.format(min(run[key] for run in runs), max(run[key] for run in runs)) for key in ['import', 'first', 'warm']]))
@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+
+###############################################################################################################
+# Language     :  Python (3.x)
+# Filename     :  bench_snmp_session.py
+# Autor        :  https://github.com/nosari20
+# Description  :  Benchmark of the shared SNMP engine (snmp_util.snmp_session) against one engine per query
+# Repository   :  https://github.com/nosari20/centreon-mobileiron-plugin
+###############################################################################################################
+#
+# Usage: sudo ./tools/bench_snmp_session.py [--cycles 20] [--host 127.0.0.2]
+#
+# A local agent (tools/snmp_agent.py) is started on UDP 161 of host, a cycle runs the memory, uptime,
+# storage and cpu queries. "per query" rebuilds the engine before every query (behaviour before the
+# shared session), "shared" keeps it for the whole process.
+#
+### Changelog ###
+#
+# ~~ Version 0.1 ~~
+#
+#
+###############################################################################################################
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['MI_PLUGIN_CACHE_DIR'] = tempfile.mkdtemp()
+
+from utils import snmp_util
+from tools.snmp_agent import SnmpAgent
+
+MEMORY = ['iso.org.dod.internet.mgmt.mib-2.25.2.3.1.4.1', 'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.5.1', 'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.6.1']
+UPTIME = ['iso.org.dod.internet.mgmt.mib-2.25.1.1.0']
+STORAGE = ['iso.org.dod.internet.mgmt.mib-2.25.2.3.1.3', 'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.4', 'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.5', 'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.6']
+CPU = ['iso.org.dod.internet.mgmt.mib-2.25.3.3.1.2']
+
+# Drop the shared engine and transports (one engine per query)
+def reset() :
+    snmp_util.SNMP_ENGINE = None
+    snmp_util.SNMP_POOL.clear()
+
+# One cycle of the four checks, returns time per query (ms)
+def cycle(host: str, per_query: bool) -> [float] :
+    times = []
+    for query, oids in [(snmp_util.snmp_get, MEMORY), (snmp_util.snmp_get, UPTIME), (snmp_util.snmp_table, STORAGE), (snmp_util.snmp_table, CPU)] :
+        if per_query :
+            reset()
+        t0 = time.perf_counter()
+        success, result, message = query(host, oids)
+        times.append((time.perf_counter() - t0) * 1000)
+        if not success :
+            raise SystemExit('SNMP error: {}'.format(message))
+    return times
+
+
+parser = argparse.ArgumentParser(description='Shared SNMP engine benchmark')
+parser.add_argument('--cycles', dest='cycles', type=int, default=20, help='Cycles per mode (default: 20)')
+parser.add_argument('--host', dest='host', type=str, default='127.0.0.2', help='Agent address (default: 127.0.0.2)')
+args = parser.parse_args()
+
+SnmpAgent(args.host)
+
+for name, per_query in [('per query', True), ('shared', False)] :
+    reset()
+    cycles = [cycle(args.host, per_query) for _ in range(args.cycles)]
+    total = sorted(sum(times) for times in cycles)
+    get = sorted(times[1] for times in cycles[1:])
+    print('{:<10} cycle: median {:7.1f} ms, min {:7.1f} ms | warm GET: median {:6.1f} ms'.format(name, total[len(total) // 2], total[0], get[len(get) // 2]))
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+###############################################################################################################
+# Language     :  Python (3.x)
+# Filename     :  bench_status_parse.py
+# Autor        :  https://github.com/nosari20
+# Description  :  Benchmark of the streamed status page parser on a synthetic connector fleet
+# Repository   :  https://github.com/nosari20/centreon-mobileiron-plugin
+###############################################################################################################
+#
+# Usage: ./tools/bench_status_parse.py [--connectors 1000 10000] [--repeat 15]
+#
+# "full page" is the parsing before the streamed parser (whole r.text, split, filtered list, scan of each
+# line), "streamed" is status_util.status_parse over Response.iter_lines. The body is served from memory,
+# peak memory excludes it.
+#
+### Changelog ###
+#
+# ~~ Version 0.1 ~~
+#
+#
+###############################################################################################################
+
+import io
+import os
+import sys
+import timeit
+import argparse
+import tracemalloc
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import status_util
+
+#
+# Synthetic status page
+# connectors: number of connectors (one in 50 is not healthy)
+#
+# return page (bytes)
+#
+def status_page(connectors: int) -> bytes :
+    lines = ['<html><body>MOBILEIRON-STATUS: OK<br>']
+    lines += ['<tr><td>theConnectorNameString=CONNECTOR_{:05d};version=11.0.0.0;lastCheckin=2026-10-18 10:00:00;isHealthy{};</td></tr>'.format(i, ('true' if i % 50 else 'false')) for i in range(connectors)]
+    lines += ['</body></html>']
+    return '\n'.join(lines).encode()
+
+# Response reading the page from memory
+def response(page: bytes) -> requests.Response :
+    r = requests.Response()
+    r.status_code = 200
+    r.encoding = 'utf-8'
+    r.raw = io.BytesIO(page)
+    return r
+
+# Parsing before the streamed parser (core marker, then connectors of r.text)
+def full_page(page: bytes) -> dict :
+    text = response(page).text
+    core = 'MOBILEIRON-STATUS: OK' in text
+    connectors = []
+    for line in [line for line in text.split('\n') if 'theConnectorNameString' in line] :
+        connectors.append([line.replace('theConnectorNameString=', '').split(';')[0], 'isHealthytrue' in line])
+    return {'core' : core, 'connectors' : connectors}
+
+# Streamed parser
+def streamed(page: bytes) -> dict :
+    return status_util.status_parse(response(page).iter_lines(chunk_size=65536, decode_unicode=True))
+
+# Peak memory (bytes) of a parser
+def peak(parse, page: bytes) -> int :
+    tracemalloc.start()
+    parse(page)
+    size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size
+
+
+parser = argparse.ArgumentParser(description='Status page parser benchmark')
+parser.add_argument('--connectors', dest='connectors', type=int, nargs='+', default=[1000, 10000], help='Fleet sizes (default: 1000 10000)')
+parser.add_argument('--repeat', dest='repeat', type=int, default=15, help='Repetitions, the minimum is kept (default: 15)')
+args = parser.parse_args()
+
+for connectors in args.connectors :
+    page = status_page(connectors)
+
+    # Same result, except the tags around the name in the former parsing
+    expected = streamed(page)
+    assert expected['core'] and len(expected['connectors']) == connectors
+
+    print('{} connectors ({} KB)'.format(connectors, len(page) // 1024))
+    for name, parse in [('full page', full_page), ('streamed', streamed)] :
+        number = max(1, 20000 // connectors)
+        elapsed = min(timeit.repeat(lambda: parse(page), number=number, repeat=args.repeat)) / number
+        print('  {:<10} {:8.2f} ms  peak {:6.1f} MB'.format(name, elapsed * 1000, peak(parse, page) / 1024 / 1024))
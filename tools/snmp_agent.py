@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+
+###############################################################################################################
+# Language     :  Python (3.x)
+# Filename     :  snmp_agent.py
+# Autor        :  https://github.com/nosari20
+# Description  :  Minimal SNMP v1/v2c agent serving static HOST-RESOURCES-MIB data (benchmarks)
+# Repository   :  https://github.com/nosari20/centreon-mobileiron-plugin
+###############################################################################################################
+#
+# Usage: sudo ./tools/snmp_agent.py [host] [storages] [cpus]
+#
+# snmp_util always queries UDP port 161, binding it requires root
+#
+### Changelog ###
+#
+# ~~ Version 0.1 ~~
+#
+#
+###############################################################################################################
+
+import sys
+import time
+import bisect
+import socket
+import threading
+from pysnmp.proto import api
+from pyasn1.codec.ber import decoder, encoder
+
+HR = (1, 3, 6, 1, 2, 1, 25)
+
+#
+# Agent data
+# storages: number of hrStorageTable rows (physical memory first, '/' third)
+# cpus: number of hrProcessorTable rows
+#
+# return table (numeric OID => (type, value))
+#
+def build_table(storages: int = 8, cpus: int = 4) -> dict :
+
+    table = {HR + (1, 1, 0) : ('ticks', 123456789)}
+
+    descrs = ['Physical memory', 'Virtual memory', '/', '/boot', '/dev/shm', '/run', '/var', '/mi']
+    descrs += ['/mnt/m{}'.format(i) for i in range(max(0, storages - len(descrs)))]
+    for index, descr in enumerate(descrs[:storages], 1) :
+        table[HR + (2, 3, 1, 1, index)] = ('int', index)
+        table[HR + (2, 3, 1, 3, index)] = ('str', descr)
+        table[HR + (2, 3, 1, 4, index)] = ('int', 4096 if index > 1 else 1024)
+        table[HR + (2, 3, 1, 5, index)] = ('int', 1000000 + index)
+        table[HR + (2, 3, 1, 6, index)] = ('int', 250000 + index)
+
+    for index in range(cpus) :
+        table[HR + (3, 3, 1, 1, 196608 + index)] = ('oid', (0, 0))
+        table[HR + (3, 3, 1, 2, 196608 + index)] = ('int', 10 + index)
+
+    # Next subtree (end of the HOST-RESOURCES-MIB walks)
+    table[(1, 3, 6, 1, 2, 1, 31, 1, 1, 1, 1, 1)] = ('str', 'lo')
+
+    return table
+
+#
+# SNMP agent answering GET, GETNEXT and GETBULK in a background thread
+#
+class SnmpAgent :
+
+    def __init__(self, host: str = '127.0.0.2', port: int = 161, table: dict = None) :
+        self.table = (table if table != None else build_table())
+        self.keys = sorted(self.table)
+        self.requests = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        threading.Thread(target=self.loop, daemon=True).start()
+
+    def value(self, pMod, kind: str, value) :
+        if kind == 'int' :
+            return pMod.Integer(value)
+        if kind == 'str' :
+            return pMod.OctetString(value)
+        if kind == 'ticks' :
+            return pMod.TimeTicks(value)
+        return pMod.ObjectIdentifier(value)
+
+    def next_key(self, oid) :
+        position = bisect.bisect_right(self.keys, tuple(oid))
+        return (self.keys[position] if position < len(self.keys) else None)
+
+    def loop(self) :
+        while True :
+            data, address = self.sock.recvfrom(65535)
+            self.requests += 1
+
+            version = int(api.decodeMessageVersion(data))
+            pMod = api.protoModules[version]
+            message, _ = decoder.decode(data, asn1Spec=pMod.Message())
+            pdu = pMod.apiMessage.getPDU(message)
+            response = pMod.apiMessage.getResponse(message)
+            rpdu = pMod.apiMessage.getPDU(response)
+            pMod.apiPDU.setErrorStatus(rpdu, 0)
+            pMod.apiPDU.setErrorIndex(rpdu, 0)
+
+            binds = []
+            request = pMod.apiPDU.getVarBinds(pdu)
+            end = (pMod.EndOfMibView() if version else None)
+
+            if pdu.isSameTypeWith(pMod.GetRequestPDU()) :
+                for oid, _ in request :
+                    if tuple(oid) in self.table :
+                        binds.append((oid, self.value(pMod, *self.table[tuple(oid)])))
+                    else :
+                        binds.append((oid, pMod.NoSuchInstance() if version else pMod.Null()))
+
+            elif pdu.isSameTypeWith(pMod.GetNextRequestPDU()) :
+                for position, (oid, _) in enumerate(request) :
+                    key = self.next_key(oid)
+                    # v1 end of MIB: noSuchName error
+                    if key == None and not version :
+                        pMod.apiPDU.setErrorStatus(rpdu, 2)
+                        pMod.apiPDU.setErrorIndex(rpdu, position + 1)
+                        binds = list(request)
+                        break
+                    binds.append((key, self.value(pMod, *self.table[key])) if key != None else (oid, end))
+
+            elif version and pdu.isSameTypeWith(pMod.GetBulkRequestPDU()) :
+                nonRepeaters = pMod.apiBulkPDU.getNonRepeaters(pdu)
+                maxRepetitions = pMod.apiBulkPDU.getMaxRepetitions(pdu)
+                columns = [tuple(oid) for oid, _ in request]
+                for oid in columns[:nonRepeaters] :
+                    key = self.next_key(oid)
+                    binds.append((key, self.value(pMod, *self.table[key])) if key != None else (oid, end))
+                current = columns[nonRepeaters:]
+                for _ in range(maxRepetitions) :
+                    following = []
+                    for oid in current :
+                        key = self.next_key(oid)
+                        binds.append((key, self.value(pMod, *self.table[key])) if key != None else (oid, end))
+                        following.append(key if key != None else oid)
+                    current = following
+
+            pMod.apiPDU.setVarBinds(rpdu, binds)
+            self.sock.sendto(encoder.encode(response), address)
+
+
+if __name__ == '__main__' :
+    SnmpAgent(
+        sys.argv[1] if len(sys.argv) > 1 else '127.0.0.2',
+        table = build_table(int(sys.argv[2]) if len(sys.argv) > 2 else 8, int(sys.argv[3]) if len(sys.argv) > 3 else 4)
+    )
+    while True :
+        time.sleep(3600)
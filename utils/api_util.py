@@ -17,12 +17,13 @@ import requests
 import urllib3
 import json
 from typing import Any
+from utils import http_util, cache_util
 
 
 urllib3.disable_warnings()
 
 #
-# Check Core status
+# Core API request (conditional: an unchanged response is not downloaded again)
 # host:  host FQDN or IP
 # port: service port
 # filter: filter
@@ -37,12 +38,13 @@ def core_api(host: str, request: str, username: str, password: str, port: int =
 
     # Perform request
     try:
-        r = requests.get('https://'+host+'/api/v2{}'.format(request), verify=False, auth=(username, password))
+        url = 'https://{}:{}/api/v2{}'.format(host, port, request)
+        r, text, timings = http_util.timed_text(url, validators=url+'|'+username, verify=False, auth=(username, password))
 
-        # if http 200 check data
-        if r.status_code == 200:
+        # if http 200 (or 304 with last response) check data
+        if text != None:
 
-            return True, r.text
+            return True, text
 
         else:
             return False, 'HTTP ' + str(r.status_code)
@@ -55,4 +57,49 @@ def core_api(host: str, request: str, username: str, password: str, port: int =
     # Handle others errors
     except BaseException as err:
         return False, format(err)
+
+# Active devices query (denominator of the device ratio checks)
+ACTIVE_DEVICES_REQUEST = 'devices/count?adminDeviceSpaceId=1&query="common.status"="ACTIVE"'
+
+#
+# Number of active devices, shared by the device checks of the host
+# host:  host FQDN or IP
+# port: service port
+# cache_ttl: seconds the count is reused by other checks of the host with the same user (0: always queried, result still stored)
+#
+# return success (if success 1 else 0) count (or error message) age (seconds, 0 if not cached)
+#
+def active_devices(host: str, username: str, password: str, port: int = 443, cache_ttl: int = 0) -> (bool, Any, float) :
+
+    # A count is only reused by checks of the same API user
+    key = '{}:{}:{}'.format(host, port, username)
+
+    def query() -> (bool, Any, float) :
+        success, result = core_api(host, ACTIVE_DEVICES_REQUEST, username, password, port)
+        if not success :
+            return False, result, 0
+
+        try :
+            count = int(json.loads(result)['totalCount'])
+        except (ValueError, KeyError, TypeError) as err :
+            return False, 'Invalid active devices response ({})'.format(err), 0
+
+        cache_util.cache_store('devices-active', key, count)
+        return True, count, 0
+
+    if cache_ttl <= 0 :
+        return query()
+
+    hit, count, age = cache_util.cache_load('devices-active', key, cache_ttl)
+    if hit :
+        return True, count, age
+
+    # One process queries the API, the others wait and reuse the count
+    with cache_util.cache_lock('devices-active', key) :
+
+        hit, count, age = cache_util.cache_load('devices-active', key, cache_ttl)
+        if hit :
+            return True, count, age
+
+        return query()
 ###############################################################################################################
\ No newline at end of file
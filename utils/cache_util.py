@@ -0,0 +1,205 @@
+###############################################################################################################
+# Language     :  Python (3.7)
+# Filename     :  cache_util.py
+# Autor        :  https://github.com/nosari20
+# Description  :  Nagios/Centreon plugin for MobileIron Core
+# Repository   :  https://github.com/nosari20/centreon-mobileiron-plugin
+###############################################################################################################
+#
+### Changelog ###
+#
+# ~~ Version 0.1 ~~
+#
+#
+#################
+
+import os
+import re
+import hmac
+import json
+import hashlib
+import stat
+import time
+import tempfile
+import contextlib
+
+# File locking is POSIX only, without it locks are no-op
+try :
+    import fcntl
+except ImportError :
+    fcntl = None
+
+# Cache directory, shared by every plugin process of the poller
+CACHE_DIR = os.environ.get('MI_PLUGIN_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'centreon-mobileiron-plugin'))
+
+#
+# Cache directory
+# The default directory is in the shared temporary directory, it is refused (OSError) unless owned by the
+# current user without group/other write permission (entries hold sessions and responses another user could
+# plant), group/other read permissions are removed
+# name: cache name (e.g. certificate)
+# create: create missing directories
+#
+# return path
+#
+def cache_dir(name: str, create: bool = False) -> str :
+
+    path = os.path.join(CACHE_DIR, name)
+    for directory in (CACHE_DIR, path) :
+        if create :
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        # No ownership on Windows
+        if hasattr(os, 'getuid') :
+            st = os.lstat(directory)
+            if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022 :
+                raise PermissionError('Unsafe cache directory {}'.format(directory))
+            if st.st_mode & 0o077 :
+                os.chmod(directory, 0o700)
+
+    return path
+
+#
+# Cache file path
+# name: cache name (e.g. certificate)
+# key: entry key (e.g. host:port)
+# create: create missing directories
+#
+# return path
+#
+def cache_path(name: str, key: str, create: bool = False) -> str :
+    return os.path.join(cache_dir(name, create), re.sub(r'[^\w.-]', '_', key) + '.json')
+
+#
+# Keyed digest of a secret part of an entry key (e.g. SNMP community), never written in clear in file names
+# The HMAC key is created once per cache directory (secret/key, readable by the plugin user only)
+# value: secret value
+#
+# return digest (hex, changes every process if the cache directory is unusable, i.e. no cache hit)
+#
+def cache_digest(value: str) -> str :
+
+    try :
+        path = os.path.join(cache_dir('secret', True), 'key')
+
+        # First process creates the key, link fails if another one did it first
+        if not os.path.exists(path) :
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            try :
+                with os.fdopen(fd, 'wb') as f :
+                    f.write(os.urandom(32))
+                os.link(tmp, path)
+            except FileExistsError :
+                pass
+            finally :
+                os.unlink(tmp)
+
+        with open(path, 'rb') as f :
+            key = f.read()
+
+    # Cache is best effort
+    except BaseException :
+        key = os.urandom(32)
+
+    return hmac.new(key, value.encode(), hashlib.sha256).hexdigest()
+
+#
+# Load cache entry
+# name: cache name
+# key: entry key
+# ttl: maximum age in seconds (None: no limit)
+#
+# return hit (if valid entry 1 else 0) value age (seconds)
+#
+def cache_load(name: str, key: str, ttl: float = None) -> (bool, object, float) :
+
+    try :
+        with open(cache_path(name, key), 'r') as f :
+            entry = json.load(f)
+
+        age = time.time() - entry['time']
+        if ttl != None and (age > ttl or age < 0) :
+            return False, entry['value'], age
+
+        return True, entry['value'], age
+
+    # Missing or corrupted entry
+    except BaseException :
+        return False, None, -1
+
+#
+# Store cache entry (atomic, safe with concurrent readers)
+# name: cache name
+# key: entry key
+# value: JSON serializable value
+#
+# return success (if success 1 else 0)
+#
+def cache_store(name: str, key: str, value: object) -> bool :
+
+    try :
+        path = cache_path(name, key, True)
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try :
+            with os.fdopen(fd, 'w') as f :
+                json.dump({'time' : time.time(), 'value' : value}, f)
+            os.replace(tmp, path)
+
+        # No temporary file left (e.g. value not serializable, disk full)
+        except BaseException :
+            os.unlink(tmp)
+            raise
+
+        return True
+
+    # Cache is best effort
+    except BaseException :
+        return False
+
+#
+# Exclusive lock of a cache entry, shared by every plugin process (e.g. only one process logs in)
+# name: cache name
+# key: entry key
+# blocking: wait for the lock (else acquired is 0 if another process holds it)
+# timeout: maximum wait in seconds (None: no limit), acquired is 0 once elapsed
+#
+# usage: with cache_lock(name, key) as acquired : ...
+#
+@contextlib.contextmanager
+def cache_lock(name: str, key: str, blocking: bool = True, timeout: float = None) :
+
+    f = None
+    acquired = True
+    try :
+        path = cache_path(name, key, True) + '.lock'
+        f = open(path, 'a')
+        if fcntl != None :
+            if blocking and timeout == None :
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else :
+                # Bounded wait, a stuck holder does not block the other processes
+                deadline = time.monotonic() + (timeout if blocking else 0)
+                while True :
+                    try :
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError :
+                        if time.monotonic() >= deadline :
+                            raise
+                        time.sleep(0.05)
+
+    # Held by another process
+    except BlockingIOError :
+        acquired = False
+
+    # Cache is best effort, run without lock
+    except BaseException :
+        pass
+
+    try :
+        yield acquired
+    finally :
+        if f != None :
+            f.close()
+###############################################################################################################
@@ -15,63 +15,275 @@
 import socket
 import ssl
 import json
-from datetime import datetime, timedelta
+import hashlib
+import select
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from timeit import default_timer as timer
 import traceback
+from utils import cache_util
 
 # Workaround for OSError during Sentry certificate check
-import os
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.serialization import Encoding
+
+CACHE_DATE_FMT = '%Y-%m-%dT%H:%M:%S'
+
+#
+# TLS connection with an overall deadline (connect and handshake)
+# host:  host FQDN
+# port: service port
+# context: SSL context
+# timeout: deadline in seconds
+# timings: filled with TCP connect and TLS handshake time in ms (if provided)
+#
+# return SSL socket (blocking, remaining time as timeout)
+#
+def tls_connect(host: str, port: int, context: ssl.SSLContext, timeout: float = 10, timings: dict = None) -> ssl.SSLSocket :
+
+    t0 = timer()
+    deadline = t0 + timeout
+
+    sock = socket.create_connection((host, port), timeout=timeout)
+    t1 = timer()
+
+    if timings != None :
+        timings['connect'] = (t1-t0)*1000
+    try:
+        ssock = context.wrap_socket(sock, server_hostname=host, do_handshake_on_connect=False)
+    except BaseException :
+        sock.close()
+        raise
+
+    try:
+        # Non-blocking handshake so that the deadline covers it as a whole
+        ssock.setblocking(False)
+        while True :
+            try:
+                ssock.do_handshake()
+                break
+            except ssl.SSLWantReadError :
+                events = ([ssock], [])
+            except ssl.SSLWantWriteError :
+                events = ([], [ssock])
+
+            remaining = deadline - timer()
+            if remaining <= 0 or not any(select.select(events[0], events[1], [], remaining)) :
+                raise socket.timeout('TLS handshake timed out')
+
+        t2 = timer()
+        if timings != None :
+            timings['handshake'] = (t2-t1)*1000
+
+        ssock.settimeout(max(deadline - t2, 0.001))
+        return ssock
+
+    except BaseException :
+        ssock.close()
+        raise
+
+#
+# Fetch peer certificate without validation
+# host:  host FQDN
+# port: service port
+# timeout: deadline in seconds
+# timings: filled with TCP connect and TLS handshake time in ms (if provided)
+#
+# return certificate (cryptography x509)
+#
+def fetch_cert(host: str, port: int, timeout: float = 10, timings: dict = None) -> x509.Certificate :
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+
+    with tls_connect(host, port, context, timeout, timings) as ssock :
+        der = ssock.getpeercert(binary_form=True)
+
+    return x509.load_der_x509_certificate(der, default_backend())
+
+#
+# Certificate chain presented by the peer
+# ssock: SSL socket
+#
+# return list of certificates (DER), leaf first
+#
+def peer_chain(ssock: ssl.SSLSocket) -> [bytes] :
+
+    chain = None
+
+    # Python 3.13+: public API (list of DER certificates)
+    if hasattr(ssock, 'get_unverified_chain') :
+        chain = ssock.get_unverified_chain()
+
+    # Python 3.10 to 3.12: only the private _ssl object has it (undocumented, may be missing or change),
+    # any failure falls back to the leaf certificate
+    else:
+        try:
+            chain = [cert.public_bytes(ssl._ssl.ENCODING_DER) for cert in ssock._sslobj.get_unverified_chain()]
+        except Exception :
+            chain = None
+
+    # Python 3.9 and older (or private API unavailable) only expose the leaf certificate
+    if not chain :
+        chain = [ssock.getpeercert(binary_form=True)]
+
+    return chain
+
+#
+# Check certificate chain
+# host:  host FQDN
+# port: service port
+# timeout: deadline in seconds for connection and handshake
+#
+# return success (if success 1 else 0) chain (list of (subject, remaining_days), leaf first) message
+#
+def check_chain(host: str, port: int, timeout: float = 10) -> (bool, list, str) :
+
+    try:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+        with tls_connect(host, port, context, timeout) as ssock :
+            chain = peer_chain(ssock)
+
+        current = datetime.now(timezone.utc)
+        result = []
+        for der in chain :
+            cert = x509.load_der_x509_certificate(der, default_backend())
+            result.append((cert.subject.rfc4514_string(), (cert.not_valid_after_utc - current).days))
+
+        return True, result, ''
+
+    # Handle others errors
+    except BaseException as err:
+        return False, None, format(err)
+
+#
+# Check certificate chains of several ports concurrently
+# targets: list of (host, port)
+# timeout: deadline in seconds for connection and handshake
+#
+# return results ('host:port' => (success, chain, message))
+#
+def check_chains(targets: [(str, int)], timeout: float = 10) -> dict :
+
+    with ThreadPoolExecutor(max_workers=max(len(targets), 1)) as executor :
+        futures = {'{}:{}'.format(host, port): executor.submit(check_chain, host, port, timeout) for host, port in targets}
+
+    return {target: future.result() for target, future in futures.items()}
+
+#
+# Store certificate expiry in cache
+# host:  host FQDN
+# port: service port
+# der: leaf certificate (DER)
+# notAfter: expiration date (UTC)
+#
+def cache_cert(host: str, port: int, der: bytes, notAfter: datetime) :
+    cache_util.cache_store('certificate', '{}:{}'.format(host, port), {
+        'fingerprint' : hashlib.sha256(der).hexdigest(),
+        'notAfter' : notAfter.strftime(CACHE_DATE_FMT),
+    })
+
 #
 # Check certificate 
 # host:  host FQDN
 # port: service port
-# verbose: allow printing
+# cache_ttl: seconds before performing a new handshake (0: no cache)
+# revalidate_days: when less days remain, the cached expiry is only trusted if the leaf fingerprint is unchanged (certificate may have been renewed)
+# timeout: deadline in seconds for the whole check (fingerprint, validated handshake and unvalidated fallback)
 #
-# return success (if success 1 else 0) remaining_days message
+# return success (if success 1 else 0) remaining_days message timings (connect, handshake, total in ms, empty if cached)
 #
-def check_cert(host: str, port: int) -> (bool, int, str) :
+def check_cert(host: str, port: int, cache_ttl: int = 0, revalidate_days: int = 0, timeout: float = 10) -> (bool, int, str, dict) :
+
+    deadline = timer() + timeout
+
+    # Use cached expiry date if fresh enough
+    if cache_ttl > 0 :
+        hit, entry, age = cache_util.cache_load('certificate', '{}:{}'.format(host, port), cache_ttl)
+        if hit :
+            current = datetime.now(timezone.utc)
+            notAfter = datetime.strptime(entry['notAfter'], CACHE_DATE_FMT).replace(tzinfo=timezone.utc)
+            remainingDays = (notAfter - current).days
+
+            if remainingDays >= revalidate_days :
+                return True, remainingDays, 'Days remaining before expiration: {}'.format(remainingDays), {}
+
+            # Compare the live leaf fingerprint with the cached one (no validation), full check if renewed
+            timings = {}
+            t0 = timer()
+            try:
+                cert = fetch_cert(host, port, max(deadline - timer(), 0.001), timings)
+                if hashlib.sha256(cert.public_bytes(Encoding.DER)).hexdigest() == entry['fingerprint'] :
+                    timings['total'] = (timer()-t0)*1000
+                    return True, remainingDays, 'Days remaining before expiration: {}'.format(remainingDays), timings
+            except BaseException :
+                pass
+
+    timings = {}
+    t0 = timer()
 
     try:
         # Perform certificate validation
         context = ssl.create_default_context()
-        with socket.create_connection((host, port)) as sock:
-            with context.wrap_socket(sock, server_hostname=host) as ssock:
-                # SSL OK
-                # Check if the certificate will expire in less than 'warning_threshold' or 'critical_threshold' days
-                cert = ssock.getpeercert()
-                ssl_date_fmt = '%b %d %H:%M:%S %Y %Z'
-                current = datetime.now()
-                notAfter = datetime.strptime(cert['notAfter'], ssl_date_fmt)
-                notBefore = datetime.strptime(cert['notBefore'], ssl_date_fmt)
-                remainingDays = abs((current - notAfter).days)
+        with tls_connect(host, port, context, max(deadline - timer(), 0.001), timings) as ssock:
+            # SSL OK
+            # Check if the certificate will expire in less than 'warning_threshold' or 'critical_threshold' days
+            cert = ssock.getpeercert()
+            ssl_date_fmt = '%b %d %H:%M:%S %Y %Z'
+            current = datetime.now(timezone.utc)
+            notAfter = datetime.strptime(cert['notAfter'], ssl_date_fmt).replace(tzinfo=timezone.utc)
+            notBefore = datetime.strptime(cert['notBefore'], ssl_date_fmt).replace(tzinfo=timezone.utc)
+            remainingDays = (notAfter - current).days
+
+            if cache_ttl > 0 :
+                cache_cert(host, port, ssock.getpeercert(binary_form=True), notAfter)
+
+            timings['total'] = (timer()-t0)*1000
   
-                return True, remainingDays, 'Days remaining before expiration: {}'.format(remainingDays)
+            return True, remainingDays, 'Days remaining before expiration: {}'.format(remainingDays), timings
                
 
 
     # Handle SSL errors
     except ssl.SSLError as sslErr:
-        return True, 0, 'SSL: ' + str(sslErr.reason)
+        return True, 0, 'SSL: ' + str(sslErr.reason), timings
+
 
+    # Deadline reached
+    except socket.timeout as err:
+        return False, 0, format(err), timings
 
-    # Workaround for OSError during Sentry certificate check
+    # Workaround for OSError during Sentry certificate check: fetch certificate without validation
     except OSError :
-        RAW_OPENSSL_COMMAND='openssl s_client -connect {}:{} 2>/dev/null </dev/null |  sed -ne \'/-BEGIN CERTIFICATE-/,/-END CERTIFICATE-/p\''.format(host,port)
-        command = os.popen(RAW_OPENSSL_COMMAND)
-        cert_str = command.read()
-        cert = x509.load_pem_x509_certificate(bytes(cert_str,'utf8'), default_backend())
-
-        ssl_date_fmt = '%b %d %H:%M:%S %Y %Z'
-        current = datetime.now()
-        notAfter = cert.not_valid_after
-        notBefore = cert.not_valid_before
-        remainingDays = abs((current - notAfter).days)
-  
-        return True, remainingDays, 'Days remaining before expiration: {}'.format(remainingDays)
+        try:
+            # Only the time left before the deadline
+            remaining = deadline - timer()
+            if remaining <= 0 :
+                raise socket.timeout('timed out')
+            cert = fetch_cert(host, port, remaining, timings)
+
+            ssl_date_fmt = '%b %d %H:%M:%S %Y %Z'
+            current = datetime.now(timezone.utc)
+            notAfter = cert.not_valid_after_utc
+            notBefore = cert.not_valid_before_utc
+            remainingDays = (notAfter - current).days
+
+            if cache_ttl > 0 :
+                cache_cert(host, port, cert.public_bytes(Encoding.DER), notAfter)
+
+            timings['total'] = (timer()-t0)*1000
+    
+            return True, remainingDays, 'Days remaining before expiration: {}'.format(remainingDays), timings
+
+        except BaseException as err:
+            return False, 0, format(err), timings
 
     # Handle others errors
     except BaseException as err:
-        return False, 0, format(err)
+        return False, 0, format(err), timings
 ###############################################################################################################
-
@@ -0,0 +1,235 @@
+###############################################################################################################
+# Language     :  Python (3.7)
+# Filename     :  http_util.py
+# Autor        :  https://github.com/nosari20
+# Description  :  Nagios/Centreon plugin for MobileIron Core
+# Repository   :  https://github.com/nosari20/centreon-mobileiron-plugin
+###############################################################################################################
+#
+### Changelog ###
+#
+# ~~ Version 0.1 ~~
+#
+#
+#################
+
+import requests
+import urllib3
+import hashlib
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPSConnectionPool
+from timeit import default_timer as timer
+from utils import cache_util
+
+urllib3.disable_warnings()
+
+# Body transfer counters of the process (bytes on the wire, bytes saved by compression and 304 responses)
+HTTP_COUNTERS = {'requests' : 0, 'not_modified' : 0, 'received' : 0, 'saved' : 0}
+
+# Connect and read timeouts (seconds) of requests without explicit timeout
+HTTP_TIMEOUT = (5, 30)
+
+# Shared session of the process (see http_session)
+HTTP_SESSION = {}
+
+#
+# HTTP adapter measuring connection setup
+# timings: TCP connect and TLS handshake time (ms) of the last connection opened
+# Timings are shared by the requests of the adapter: callers are single-threaded (one request at a time)
+#
+class TimingAdapter(HTTPAdapter) :
+
+    def __init__(self, *args, **kwargs) :
+        self.timings = {}
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) :
+        super().init_poolmanager(*args, **kwargs)
+
+        timings = self.timings
+
+        class TimedHTTPSConnection(HTTPSConnection) :
+
+            # TCP connect
+            def _new_conn(self) :
+                t0 = timer()
+                conn = super()._new_conn()
+                timings['connect'] = (timer()-t0)*1000
+                return conn
+
+            # TCP connect and TLS handshake
+            def connect(self) :
+                t0 = timer()
+                super().connect()
+                timings['handshake'] = (timer()-t0)*1000 - timings.get('connect', 0)
+
+        class TimedHTTPSConnectionPool(HTTPSConnectionPool) :
+            ConnectionCls = TimedHTTPSConnection
+
+        self.poolmanager.pool_classes_by_scheme = dict(self.poolmanager.pool_classes_by_scheme, https=TimedHTTPSConnectionPool)
+
+#
+# Timing breakdown of a request
+# adapter: timing adapter of the session
+# r: response
+# total: total time (ms)
+#
+# return timings (connect, handshake, ttfb, total in ms)
+#
+def timings_breakdown(adapter: TimingAdapter, r: requests.Response, total: float) -> dict :
+
+    # Connection reused: no setup time
+    connect = adapter.timings.get('connect', 0)
+    handshake = adapter.timings.get('handshake', 0)
+
+    return {
+        'connect' : connect,
+        'handshake' : handshake,
+        'ttfb' : max(r.elapsed.total_seconds()*1000 - connect - handshake, 0),
+        'total' : total,
+    }
+
+#
+# Shared HTTP session of the process, keep-alive connections (and their TLS session) are reused by every request
+# Not for concurrent requests: the adapter timings are those of the last request (see TimingAdapter)
+#
+# return session timing adapter
+#
+def http_session() -> (requests.Session, TimingAdapter) :
+
+    if 'session' not in HTTP_SESSION :
+        adapter = TimingAdapter(pool_connections=4, pool_maxsize=4, max_retries=0)
+        session = requests.Session()
+        session.mount('https://', adapter)
+
+        # Compressed bodies (requests decodes them while streaming)
+        session.headers['Accept-Encoding'] = 'gzip'
+
+        HTTP_SESSION['session'] = session
+        HTTP_SESSION['adapter'] = adapter
+
+    return HTTP_SESSION['session'], HTTP_SESSION['adapter']
+
+#
+# HTTP GET with timing breakdown
+# url: URL
+# kwargs: requests options
+#
+# return response timings (connect, handshake, ttfb, total in ms)
+#
+def timed_get(url: str, **kwargs) -> (requests.Response, dict) :
+
+    session, adapter = http_session()
+    adapter.timings.clear()
+    kwargs.setdefault('timeout', HTTP_TIMEOUT)
+
+    t0 = timer()
+    r = session.get(url, **kwargs)
+    t1 = timer()
+
+    return r, timings_breakdown(adapter, r, (t1-t0)*1000)
+
+#
+# HTTP GET with ETag/Last-Modified revalidation and timing breakdown (streamed, see timed_lines and timed_text)
+# url: URL
+# read: function of the HTTP 200 response returning the result and the decoded body size
+# validators: cache key of the URL (e.g. URL and user), ETag/Last-Modified and result are kept
+#             and a 304 Not Modified response reuses the last result (None: unconditional request)
+# kwargs: requests options
+#
+# return response (body consumed) result (None if not HTTP 200 or 304) timings (connect, handshake, ttfb, total in ms)
+#
+def timed_read(url: str, read, validators: str = None, **kwargs) -> (requests.Response, object, dict) :
+
+    # Conditional request from the validators of the last download
+    entry = None
+    if validators != None :
+        key = hashlib.sha1(validators.encode()).hexdigest()
+        hit, entry, age = cache_util.cache_load('http-validators', key)
+        if hit :
+            headers = dict(kwargs.pop('headers', None) or {})
+            if entry['etag'] != None :
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified'] != None :
+                headers['If-Modified-Since'] = entry['last_modified']
+            kwargs['headers'] = headers
+        else:
+            entry = None
+
+    session, adapter = http_session()
+    adapter.timings.clear()
+    kwargs.setdefault('timeout', HTTP_TIMEOUT)
+
+    result = None
+    size = 0
+    t0 = timer()
+    with session.get(url, stream=True, **kwargs) as r :
+        if r.status_code == 200 :
+            if r.encoding == None :
+                r.encoding = 'utf-8'
+            result, size = read(r)
+        else:
+            # Read the (empty or short) body so the connection goes back to the pool
+            r.content
+        received = r.raw.tell()
+    t1 = timer()
+
+    HTTP_COUNTERS['requests'] += 1
+    HTTP_COUNTERS['received'] += received
+
+    # Not modified: last result reused, whole body saved
+    if r.status_code == 304 and entry != None :
+        result = entry['result']
+        HTTP_COUNTERS['not_modified'] += 1
+        HTTP_COUNTERS['saved'] += max(entry['size'] - received, 0)
+
+    if r.status_code == 200 :
+        HTTP_COUNTERS['saved'] += max(size - received, 0)
+        if validators != None and ('ETag' in r.headers or 'Last-Modified' in r.headers) :
+            cache_util.cache_store('http-validators', key, {
+                'etag' : r.headers.get('ETag'),
+                'last_modified' : r.headers.get('Last-Modified'),
+                'result' : result,
+                'size' : size
+            })
+
+    return r, result, timings_breakdown(adapter, r, (t1-t0)*1000)
+
+#
+# HTTP GET streamed line by line to a parser, the body is never loaded in memory
+# url: URL
+# parse: function of the lines iterator (str lines) returning the result, called on HTTP 200 only
+# chunk_size: read size in bytes
+# validators: cache key of the URL (e.g. URL and user), parsed result reused on 304 (see timed_read)
+# kwargs: requests options
+#
+# return response (body consumed) result (None if not HTTP 200 or 304) timings (connect, handshake, ttfb, total in ms)
+#
+def timed_lines(url: str, parse, chunk_size: int = 65536, validators: str = None, **kwargs) -> (requests.Response, object, dict) :
+
+    def read(r: requests.Response) -> (object, int) :
+        size = [0]
+
+        # Decoded body size (characters, one per line end)
+        def counted(lines) :
+            for line in lines :
+                size[0] += len(line) + 1
+                yield line
+
+        result = parse(counted(r.iter_lines(chunk_size=chunk_size, decode_unicode=True)))
+        return result, size[0]
+
+    return timed_read(url, read, validators, **kwargs)
+
+#
+# HTTP GET of the whole body (text unchanged)
+# url: URL
+# validators: cache key of the URL (e.g. URL and user), body reused on 304 (see timed_read)
+# kwargs: requests options
+#
+# return response text (None if not HTTP 200 or 304) timings (connect, handshake, ttfb, total in ms)
+#
+def timed_text(url: str, validators: str = None, **kwargs) -> (requests.Response, str, dict) :
+    return timed_read(url, lambda r: (r.text, len(r.content)), validators, **kwargs)
+###############################################################################################################
\ No newline at end of file
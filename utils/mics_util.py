@@ -13,116 +13,470 @@
 #
 #################
 
+import os
+import json
+import hashlib
+import concurrent.futures
 import requests
 import ssl
 import urllib3
 import re
+from utils import cache_util, http_util
 
 urllib3.disable_warnings()
 
+# Seconds a check waits for the login or diagnostics of another process before going on without it
+MICS_LOCK_TIMEOUT = 10
+
 #
-# Check Core status
+# MICS login
+# session: requests session (cookies are set on success)
 # host:  host FQDN or IP
 # username: MICS username
 # password: MICS password
 # port: service port
 #
-# return success (if success 1 else 0) output
+# return success (if success 1 else 0) csrf (csrfKey, csrfNonce) message
+#
+def mics_login(session: requests.Session, host: str, username:str, password:str, port: int = 8443) -> (bool, tuple, str) :
+
+    # Login most data
+    post_data = {
+        'j_username' : username,
+        'j_password' : password
+    }
+
+    # Login additional headers
+    headers = {
+        'referer' : 'https://{}:{}/mics/login.jsp'.format(host,port)
+    }
+
+    # Perform login
+    r = session.post(
+        'https://{}:{}/mics/j_spring_security_check'.format(host,port),
+        headers = headers, 
+        data = post_data,
+        verify=False,
+        timeout=http_util.HTTP_TIMEOUT
+    )
+
+    # If http 200 check data
+    if r.status_code != 200:
+        return False, None, 'LOGIN: HTTP ' + str(r.status_code)
+
+    content = r.text
+    # Check if succesfull login
+    if 'Login Failed' in content :
+        return False, None, 'LOGIN: Login Failed. Invalid username or password. Multiple invalid attempts may result in account lockout.'
+
+    # Retrieve session and csrf info
+    csrfKey = re.search(r'csrfKey = \"(\w+)\";', content).group(1)
+    csrfNonce = re.search(r'csrfNonce = \"(\w+)\";', content).group(1)
+
+    # Set additional cookies
+    session.cookies.set('_mi_isLoggedIn', '1')
+
+    return True, (csrfKey, csrfNonce), None
+
+#
+# MICS request with a logged in session
+# session: requests session
+# host:  host FQDN or IP
+# username: MICS username
+# csrf: (csrfKey, csrfNonce) of the session
+# uri: request URI
+# method: GET or POST
+# data: POST data
+# port: service port
+#
+# return response (redirects are not followed, an expired session is redirected to login)
+# Requests use the connect and read timeouts of the Core HTTP traffic (http_util.HTTP_TIMEOUT)
+#
+def mics_request(session: requests.Session, host: str, username:str, csrf: tuple, uri:str, method:str = 'GET', data:dict = {}, port: int = 8443) -> requests.Response :
+
+    # Request additional headers
+    headers = {
+        'authUserId' : username,
+        'Origin' : 'https://{}:{}'.format(host,port),
+        'referer' : 'https://{}:{}/mics/mics.html'.format(host,port),
+        'X-Requested-With' : 'XMLHttpRequest',
+        csrf[0] : csrf[1]
+    }
+
+    if method == 'POST' :
+        return session.post(
+            'https://{}:{}/{}'.format(host,port,uri),
+            headers = headers, 
+            verify=False,
+            data = data,
+            allow_redirects=False,
+            timeout=http_util.HTTP_TIMEOUT
+        )
+
+    return session.request(
+        method,
+        'https://{}:{}/{}'.format(host,port,uri),
+        headers = headers, 
+        verify=False,
+        allow_redirects=False,
+        timeout=http_util.HTTP_TIMEOUT
+    )
+
+#
+# MICS session expired (401 or redirect to login page)
+# r: response
+#
+# return expired (if expired 1 else 0)
+#
+def mics_expired(r: requests.Response) -> bool :
+    return r.status_code == 401 or (r.is_redirect and 'login' in r.headers.get('Location', '').lower())
+
+#
+# MICS authentication, one process logs in and the others reuse its session
+# A process waiting more than MICS_LOCK_TIMEOUT logs in itself
+# session: requests session
+# host:  host FQDN or IP
+# username: MICS username
+# password: MICS password
+# port: service port
+# session_cache: store the session for next checks
+# stale: expired session entry (None if no session)
+#
+# return success (if success 1 else 0) entry ({'cookies', 'csrf'}) fresh (if logged in 1 else 0) message
+#
+def mics_authenticate(session: requests.Session, host: str, username:str, password:str, port: int = 8443, session_cache: bool = True, stale: dict = None) -> (bool, dict, bool, str) :
+
+    key = '{}:{}:{}'.format(host, port, username)
+    with cache_util.cache_lock('mics-session', key, timeout=MICS_LOCK_TIMEOUT) :
+
+        # Session stored by another process while waiting for the lock
+        if session_cache :
+            hit, latest, age = cache_util.cache_load('mics-session', key)
+            if hit and latest != stale :
+                return True, latest, False, None
+
+        session.cookies.clear()
+        success, csrf, message = mics_login(session, host, username, password, port)
+        if not success :
+            return False, None, False, message
+
+        entry = {
+            'cookies' : requests.utils.dict_from_cookiejar(session.cookies),
+            'csrf' : list(csrf)
+        }
+        if session_cache :
+            cache_util.cache_store('mics-session', key, entry)
+
+        return True, entry, True, None
+
+#
+# MICS output cache key
+# host:  host FQDN or IP
+# port: service port
+# query: {'uri', 'method', 'data'}
+#
+# return key
+#
+def mics_cache_key(host: str, port: int, query: dict) -> str :
+    return '{}:{}:{}'.format(host, port, hashlib.sha1(json.dumps([query['uri'].lstrip('/'), query.get('method', 'GET'), query.get('data', {})], sort_keys=True).encode()).hexdigest()[:16])
+
+#
+# Refresh cached MICS outputs in a detached background process (stale-while-revalidate)
+# host:  host FQDN or IP
+# username: MICS username
+# password: MICS password
+# queries: list of {'uri', 'method', 'data'}
+# port: service port
+# session_cache: reuse the stored session
+#
+# return started (if started 1 else 0, fork not supported)
+#
+def mics_revalidate(host: str, username:str, password:str, queries: [dict], port: int = 8443, session_cache: bool = True) -> bool :
+
+    if not hasattr(os, 'fork') :
+        return False
+
+    try :
+        pid = os.fork()
+    except OSError :
+        return False
+
+    # Intermediate process exits immediately, the check is not delayed
+    if pid != 0 :
+        os.waitpid(pid, 0)
+        return True
+
+    try :
+        os.setsid()
+        if os.fork() != 0 :
+            os._exit(0)
+
+        # Do not keep the monitoring engine pipes open
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in range(3) :
+            os.dup2(devnull, fd)
+
+        # Only one refresh per host, skipped while another process runs the diagnostics
+        with cache_util.cache_lock('mics-diagnostic', '{}:{}'.format(host, port), blocking=False) as acquired :
+            if acquired :
+                success, results, message = mics_queries(host, username, password, queries, port, session_cache)
+                if success :
+                    for query, (query_success, output, age) in zip(queries, results) :
+                        if query_success :
+                            cache_util.cache_store('mics-diagnostic', mics_cache_key(host, port, query), output)
+    finally :
+        os._exit(0)
+
+#
+# Send several MICS requests with one login over the same keep-alive session
+# host:  host FQDN or IP
+# username: MICS username
+# password: MICS password
+# queries: list of {'uri', 'method', 'data'} (method default GET)
+# port: service port
+# session_cache: reuse the session (cookies and CSRF token) of previous checks, login only when expired
+# concurrency: maximum concurrent requests
+# cache_ttl: seconds an output is reused (0: no cache), older outputs are refreshed in background
+# cache_max_age: maximum age in seconds of an output returned while refreshed
 #
+# return success (if success 1 else 0) results (list of (success, output, age) in queries order, age 0 if not cached) message
 #
-def mics_info(host: str, username:str, password:str, uri:str, method:str = 'GET', data:dict = {}, port: int = 8443) -> (bool, str) :
-    
+def mics_queries(host: str, username:str, password:str, queries: [dict], port: int = 8443, session_cache: bool = True, concurrency: int = 4, cache_ttl: float = 0, cache_max_age: float = 0) -> (bool, [tuple], str) :
+
+    results = [None] * len(queries)
+
     # Sanitize input
-    if uri.startswith('/') :
-        uri = uri[1:]
+    requests_args = []
+    for i, query in enumerate(queries) :
+        uri = query['uri']
+        if uri.startswith('/') :
+            uri = uri[1:]
+        method = query.get('method', 'GET')
+        if method not in ['GET', 'POST'] :
+            results[i] = (False, 'Method \'{}\' not supported'.format(method), 0)
+        requests_args.append((uri, method, query.get('data', {})))
+
+    # Cached outputs, stale ones are returned at once and refreshed in background
+    if cache_ttl > 0 :
+        keys = [mics_cache_key(host, port, query) for query in queries]
+        stale = []
+        for i in range(len(queries)) :
+            if results[i] == None :
+                hit, output, age = cache_util.cache_load('mics-diagnostic', keys[i], max(cache_ttl, cache_max_age))
+                if hit :
+                    results[i] = (True, output, age)
+                    if age > cache_ttl :
+                        stale.append(i)
+
+        # Without background process, stale outputs are refreshed now
+        if len(stale) > 0 and not mics_revalidate(host, username, password, [queries[i] for i in stale], port, session_cache) :
+            for i in stale :
+                results[i] = None
+
+        missing = [i for i in range(len(queries)) if results[i] == None]
+        if len(missing) == 0 :
+            return True, results, None
+
+        # One process runs the diagnostics, the others wait (at most MICS_LOCK_TIMEOUT) and reuse its outputs
+        with cache_util.cache_lock('mics-diagnostic', '{}:{}'.format(host, port), timeout=MICS_LOCK_TIMEOUT) as acquired :
+            for i in missing :
+                hit, output, age = cache_util.cache_load('mics-diagnostic', keys[i], cache_ttl)
+                if hit :
+                    results[i] = (True, output, age)
+            missing = [i for i in missing if results[i] == None]
+
+            # Outputs stored by the process that held the lock
+            if len(missing) == 0 :
+                return True, results, None
+
+            # Diagnostics still running in another process: last outputs whatever their age, no wait
+            if not acquired :
+                for i in missing :
+                    hit, output, age = cache_util.cache_load('mics-diagnostic', keys[i])
+                    results[i] = ((True, output, age) if hit else (False, 'Diagnostic running in another check, no previous output', 0))
+                return True, results, None
+
+            success, outputs, message = mics_queries(host, username, password, [queries[i] for i in missing], port, session_cache, concurrency)
+            if not success :
+                return False, None, message
 
-    if method not in ['GET', 'POST'] :
-        return False, 'Method \'{}\' not supported'.format(method)
-    
+            for i, output in zip(missing, outputs) :
+                results[i] = output
+                if output[0] :
+                    cache_util.cache_store('mics-diagnostic', keys[i], output[1])
+
+        return True, results, None
 
     try:
 
-        # Login most data
-        post_data = {
-            'j_username' : username,
-            'j_password' : password
-        }
+        # Create session, one keep-alive connection per concurrent request
+        concurrency = max(1, min(concurrency, len(queries)))
+        session = requests.Session()
+        session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
 
-        # Login additional headers
-        headers = {
-            'referer' : 'https://{}:{}/mics/login.jsp'.format(host,port)
-        }
+        # Stored session of a previous check
+        entry = None
+        if session_cache :
+            hit, stored, age = cache_util.cache_load('mics-session', '{}:{}:{}'.format(host, port, username))
+            if hit :
+                entry = stored
 
-        # Create session
-        session = requests.Session() 
+        # Request errors are returned per query
+        def mics_query(i: int) :
+            try :
+                return mics_request(session, host, username, entry['csrf'], requests_args[i][0], requests_args[i][1], requests_args[i][2], port)
+            except BaseException as err :
+                return err
 
-        # Perform login
-        r = session.post(
-            'https://{}:{}/mics/j_spring_security_check'.format(host,port),
-            headers = headers, 
-            data = post_data,
-            verify=False
-        )
+        responses = [None] * len(queries)
+        fresh = False
+        stale = None
+        for attempt in range(3) :
+
+            if entry == None :
+                success, entry, fresh, message = mics_authenticate(session, host, username, password, port, session_cache, stale)
+                if not success :
+                    return False, None, message
 
-        # If http 200 check data
-        if r.status_code == 200:
+            session.cookies.clear()
+            session.cookies.update(entry['cookies'])
 
-            content = r.text
-            # Check if succesfull login
-            if 'Login Failed' in content :
-                return False, 'LOGIN: Login Failed. Invalid username or password. Multiple invalid attempts may result in account lockout.'
+            # Queries without response or with an expired session
+            pending = [i for i in range(len(queries)) if results[i] == None and (responses[i] == None or (isinstance(responses[i], requests.Response) and mics_expired(responses[i])))]
+            if len(pending) == 0 :
+                break
+
+            if concurrency > 1 and len(pending) > 1 :
+                with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor :
+                    for i, r in zip(pending, executor.map(mics_query, pending)) :
+                        responses[i] = r
             else :
+                for i in pending :
+                    responses[i] = mics_query(i)
 
-                # Retrieve session and csrf info
-                csrfKey = re.search(r'csrfKey = \"(\w+)\";', content).group(1)
-                csrfNonce = re.search(r'csrfNonce = \"(\w+)\";', content).group(1)
-
-                # Set additional cookies
-                session.cookies.set('_mi_isLoggedIn', '1')
-
-                # Request additional headers
-                headers = {
-                    'authUserId' : username,
-                    'Origin' : 'https://{}:{}'.format(host,port),
-                    'referer' : 'https://{}:{}/mics/mics.html'.format(host,port),
-                    'X-Requested-With' : 'XMLHttpRequest',
-                    csrfKey : csrfNonce
-                }
-
-                if method == 'POST' :
-                    r = session.post(
-                        #'https://{}:{}/mics/mics.html?_dc=1585491075918&servicename=DNS&action=testDiagnosticService&command=testDiagnosticService'.format(host,port),
-                        'https://{}:{}/{}'.format(host,port,uri),
-                        headers = headers, 
-                        verify=False,
-                        data = data,
-                    )
-                else :
-                    r = session.request(
-                        method,
-                        #'https://{}:{}/mics/mics.html?_dc=1585491075918&servicename=DNS&action=testDiagnosticService&command=testDiagnosticService'.format(host,port),
-                        'https://{}:{}/{}'.format(host,port,uri),
-                        headers = headers, 
-                        verify=False
-                    )
-
-                if r.status_code == 200:
-                    return True, r.text
-                else:
-                    return False, 'REQUEST: HTTP ' + str(r.status_code)
-                print(r.text)
-
-            
-
-        else:
-            return False, 'LOGIN: HTTP ' + str(r.status_code)
+            if fresh or not any(isinstance(r, requests.Response) and mics_expired(r) for r in responses) :
+                break
 
+            # Session expired, login (or reuse the session of another process) and resend expired queries
+            stale = entry
+            entry = None
+
+        for i, r in enumerate(responses) :
+            if results[i] != None :
+                continue
+            if isinstance(r, BaseException) :
+                results[i] = (False, format(r), 0)
+            elif r.status_code == 200 :
+                results[i] = (True, r.text, 0)
+            else :
+                results[i] = (False, 'REQUEST: HTTP ' + str(r.status_code), 0)
+
+        return True, results, None
 
     # Handle HTTP errors
     except requests.exceptions.HTTPError as e:
-        return False, e.response.text
+        return False, None, e.response.text
 
     # Handle others errors
     except BaseException as err:
-        return False, format(err)
+        return False, None, format(err)
+
+#
+# Check Core status
+# host:  host FQDN or IP
+# username: MICS username
+# password: MICS password
+# port: service port
+# session_cache: reuse the session (cookies and CSRF token) of previous checks, login only when expired
+#
+# return success (if success 1 else 0) output
+#
+#
+def mics_info(host: str, username:str, password:str, uri:str, method:str = 'GET', data:dict = {}, port: int = 8443, session_cache: bool = True) -> (bool, str) :
+
+    success, results, message = mics_queries(
+        host = host,
+        username = username,
+        password = password,
+        queries = [{'uri' : uri, 'method' : method, 'data' : data}],
+        port = port,
+        session_cache = session_cache,
+        concurrency = 1
+    )
+
+    if not success :
+        return False, message
+
+    return results[0][:2]
+
+#
+# MICS active diagnostic (e.g. DNS, NTP test), cached and refreshed in background
+# host:  host FQDN or IP
+# username: MICS username
+# password: MICS password
+# port: service port
+# session_cache: reuse the session (cookies and CSRF token) of previous checks, login only when expired
+# cache_ttl: seconds the output is reused (0: no cache), older output is refreshed in background
+# cache_max_age: maximum age in seconds of an output returned while refreshed
+#
+# return success (if success 1 else 0) output age (seconds, 0 if not cached)
+#
+def mics_diagnostic(host: str, username:str, password:str, uri:str, method:str = 'GET', data:dict = {}, port: int = 8443, session_cache: bool = True, cache_ttl: float = 0, cache_max_age: float = 0) -> (bool, str, float) :
+
+    success, results, message = mics_queries(
+        host = host,
+        username = username,
+        password = password,
+        queries = [{'uri' : uri, 'method' : method, 'data' : data}],
+        port = port,
+        session_cache = session_cache,
+        concurrency = 1,
+        cache_ttl = cache_ttl,
+        cache_max_age = cache_max_age
+    )
+
+    if not success :
+        return False, message, 0
+
+    return results[0]
+
+# Sentry utilization pair, several per line (e.g. 'Number of Connected Devices  : 12', 'SYSTEM_SCALE=Small # tuned')
+# Value is a number with optional unit (e.g. '1,700', '12.5 %', '512 MB') or a single word, followed by the end of
+# the line, a comment/separator or the next pair (else the pair is skipped, e.g. 'Uptime : 3 days')
+MICS_UTILIZATION_PAIR = re.compile(r'([A-Za-z][\w ()/.-]*?)\s*[:=]\s*(?:(-?[0-9][0-9,]*(?:\.[0-9]+)?)(?:\s*(%|(?:[KMGT]?B|ms|s)\b))?|(\w+))(?=\s*(?:$|[#;,|]|[A-Za-z][\w ()/.-]*?\s*[:=]))', re.M)
+
+#
+# Parse Sentry utilization (getSentryUtilization response) in a single pass
+# result: MICS response (JSON with 'utilization' and 'systemScale' text)
+#
+# return counters ({name: (value, unit)} numeric values in payload order) attributes ({name: text} other values)
+# names are lowercase with underscores (e.g. number_of_connected_devices, system_scale)
+#
+def mics_utilization(result: str) -> (dict, dict) :
+
+    json_res = json.loads(result)
+    utilization = str(json_res.get('utilization', ''))
+    system_scale = str(json_res.get('systemScale', ''))
+
+    counters = dict()
+    attributes = dict()
+    for text in [utilization, system_scale] :
+        for match in MICS_UTILIZATION_PAIR.finditer(text) :
+            name = re.sub(r'[^a-z0-9]+', '_', match.group(1).lower()).strip('_')
+            if match.group(2) != None :
+                counters[name] = (float(match.group(2).replace(',', '')), match.group(3) or '')
+            else :
+                attributes[name] = match.group(4)
+
+    # Former searches of the devices check values
+    if 'number_of_connected_devices' not in counters :
+        match = re.search(r'Number of Connected Devices  : ([0-9]+)', utilization)
+        if match != None :
+            counters['number_of_connected_devices'] = (float(match.group(1)), '')
+    if 'system_scale' not in attributes :
+        match = re.search(r'SYSTEM_SCALE=(\w+)', system_scale)
+        if match != None :
+            attributes['system_scale'] = match.group(1)
+
+    return counters, attributes
 ###############################################################################################################
\ No newline at end of file
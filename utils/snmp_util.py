@@ -12,7 +12,356 @@
 #
 #################
 
+import asyncio
+import socket
+import time
+from array import array
 from pysnmp.hlapi import *
+from pysnmp.carrier.asyncore.dispatch import AsyncoreDispatcher
+from pysnmp.proto import api
+from pysnmp.proto.rfc1905 import endOfMibView, noSuchInstance, noSuchObject
+from pyasn1.codec.ber import encoder, decoder
+from pyasn1.type import univ
+from utils import cache_util
+
+# Shared SNMP engine and transports, created once per process
+SNMP_ENGINE = None
+SNMP_POOL = {}
+
+# Request timeout (seconds, upper bound of the RTT based timeout) and retries
+SNMP_TIMEOUT = 1
+SNMP_TIMEOUT_MIN = 0.05
+SNMP_RETRIES = 5
+# Hedged requests: a copy of late get/table requests is sent at half the timeout, the first reply of any copy is used
+SNMP_HEDGE = False
+
+# Round trip statistics per host, and request/response counters of the engine
+SNMP_STATS = {}
+SNMP_COUNTERS = {'sent' : 0, 'received' : 0, 'sent_time' : 0, 'rtt' : 0}
+
+# Numeric OIDs of the objects polled by the checks, requests and responses skip MIB name resolution
+SNMP_OIDS = {
+    # HOST-RESOURCES-MIB::hrSystemUptime
+    'iso.org.dod.internet.mgmt.mib-2.25.1.1' : (1, 3, 6, 1, 2, 1, 25, 1, 1),
+    'iso.org.dod.internet.mgmt.mib-2.25.1.1.0' : (1, 3, 6, 1, 2, 1, 25, 1, 1, 0),
+    # HOST-RESOURCES-MIB::hrStorageTable columns (descr, allocation units, size, used)
+    'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.3' : (1, 3, 6, 1, 2, 1, 25, 2, 3, 1, 3),
+    'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.4' : (1, 3, 6, 1, 2, 1, 25, 2, 3, 1, 4),
+    'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.5' : (1, 3, 6, 1, 2, 1, 25, 2, 3, 1, 5),
+    'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.6' : (1, 3, 6, 1, 2, 1, 25, 2, 3, 1, 6),
+    # hrStorageTable row 1 (physical memory)
+    'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.4.1' : (1, 3, 6, 1, 2, 1, 25, 2, 3, 1, 4, 1),
+    'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.5.1' : (1, 3, 6, 1, 2, 1, 25, 2, 3, 1, 5, 1),
+    'iso.org.dod.internet.mgmt.mib-2.25.2.3.1.6.1' : (1, 3, 6, 1, 2, 1, 25, 2, 3, 1, 6, 1),
+    # HOST-RESOURCES-MIB::hrProcessorTable columns (firmware ID, load)
+    'iso.org.dod.internet.mgmt.mib-2.25.3.3.1.1' : (1, 3, 6, 1, 2, 1, 25, 3, 3, 1, 1),
+    'iso.org.dod.internet.mgmt.mib-2.25.3.3.1.2' : (1, 3, 6, 1, 2, 1, 25, 3, 3, 1, 2),
+}
+
+# Timeout message (pysnmp RequestTimedOut error indication)
+SNMP_NO_RESPONSE = 'No SNMP response received before timeout'
+
+# Exception values of a variable (no value at this OID)
+SNMP_EXCEPTIONS = (endOfMibView.tagSet, noSuchInstance.tagSet, noSuchObject.tagSet)
+
+# Numeric values of the symbolic prefixes, for OIDs missing from SNMP_OIDS
+SNMP_OID_PREFIXES = {
+    'iso.org.dod.internet.mgmt.mib-2' : (1, 3, 6, 1, 2, 1),
+    'iso.org.dod.internet.private.enterprises' : (1, 3, 6, 1, 4, 1),
+    'iso.org.dod.internet' : (1, 3, 6, 1),
+}
+
+#
+# SNMP numeric OID
+# oid: symbolic (iso.org.dod.internet.mgmt.mib-2.x) or numeric (1.3.6.1.2.1.x) dotted OID
+# return OID as a tuple of integers (computed once and kept in SNMP_OIDS)
+#
+def snmp_oid(oid: str) -> tuple :
+
+    if oid not in SNMP_OIDS :
+        numeric = ()
+        suffix = oid
+        for prefix in SNMP_OID_PREFIXES :
+            if oid == prefix or oid.startswith(prefix + '.') :
+                numeric = SNMP_OID_PREFIXES[prefix]
+                suffix = oid[len(prefix) + 1:]
+                break
+        SNMP_OIDS[oid] = numeric + tuple(int(sub) for sub in suffix.split('.') if sub != '')
+
+    return SNMP_OIDS[oid]
+
+#
+# Missing value (noSuchInstance, noSuchObject or endOfMibView exception instead of a value)
+# value: pyasn1 or python value
+#
+# return missing
+#
+def snmp_missing(value) -> bool :
+    return getattr(value, 'tagSet', None) in SNMP_EXCEPTIONS
+
+#
+# SNMP table row (view on one row of a SnmpTable)
+# Values are read with the column OID like the former row dicts (row[oid])
+#
+class SnmpRow :
+
+    __slots__ = ('table', 'position')
+
+    def __init__(self, table, position: int) :
+        self.table = table
+        self.position = position
+
+    @property
+    def index(self) -> int :
+        return self.table.indexes[self.position]
+
+    def __getitem__(self, oid: str) :
+        return self.table.columns[oid][self.position]
+
+    def __contains__(self, oid: str) -> bool :
+        return oid in self.table.columns
+
+    def get(self, oid: str, default = None) :
+        return (self[oid] if oid in self.table.columns else default)
+
+#
+# SNMP table result, one typed column per OID
+# Integer columns (counters, gauges, units...) are array('q'), others are lists of str
+# indexes: row index (last sub-identifier) of each row
+#
+class SnmpTable :
+
+    __slots__ = ('oids', 'indexes', 'columns')
+
+    def __init__(self, oids: [str]) :
+        self.oids = oids
+        self.indexes = array('q')
+        # Column type is set by the first value (missing values excluded)
+        self.columns = {oid: None for oid in oids}
+
+    def __len__(self) -> int :
+        return len(self.indexes)
+
+    def __getitem__(self, position: int) -> SnmpRow :
+        if position < 0 :
+            position += len(self.indexes)
+        if position < 0 or position >= len(self.indexes) :
+            raise IndexError('table row out of range')
+        return SnmpRow(self, position)
+
+    def __iter__(self) :
+        for position in range(len(self.indexes)) :
+            yield SnmpRow(self, position)
+
+    # Add a row (values in the order of oids, pyasn1 or python values)
+    # A row with a missing cell is skipped, the exception would otherwise make an integer column str
+    # return row added
+    def append(self, index: int, values: list) -> bool :
+        if any(snmp_missing(value) for value in values) :
+            return False
+
+        self.indexes.append(index)
+        for oid, value in zip(self.oids, values) :
+            column = self.columns[oid]
+            if column == None :
+                column = self.columns[oid] = (array('q') if isinstance(value, (int, univ.Integer)) else [])
+
+            if type(column) is list :
+                column.append(value if type(value) is str else str(value))
+            else :
+                try :
+                    column.append(int(value))
+                # Counter64 above 2**63 or non integer value, column falls back to a list
+                except (OverflowError, TypeError, ValueError) :
+                    column = self.columns[oid] = [str(v) for v in column]
+                    column.append(str(value))
+
+        return True
+
+    # Whole column (array('q') or list of str)
+    def column(self, oid: str) :
+        return (self.columns[oid] if self.columns[oid] != None else [])
+
+#
+# SNMP table from walked columns, only rows present in every column are kept
+# A column walk is positional: a missing cell would shift the other columns if rows were read as they come
+# oids: list of column OIDs
+# cells: values of each column (list in oids order of row index=>value)
+# return SnmpTable (rows in first column order)
+#
+def snmp_join(oids: [str], cells: [dict]) -> SnmpTable :
+
+    table = SnmpTable(oids)
+    for index, value in cells[0].items() :
+        if all(index in column for column in cells[1:]) :
+            table.append(index, [value] + [column[index] for column in cells[1:]])
+
+    return table
+
+#
+# Walked variable of a column
+# column: numeric column OID
+# name: variable OID
+# value: variable value
+# return row index (None if the variable left the column or has no value)
+#
+def snmp_cell(column: tuple, name, value) -> int :
+
+    if snmp_missing(value) or tuple(name)[:len(column)] != column :
+        return None
+
+    return int(name[-1])
+
+#
+# SNMP round trip statistics of a host
+# Smoothed RTT and variation (RFC 6298) are kept in cache between checks
+# timeout, requests and retries are those of the current process
+#
+class SnmpStats :
+
+    def __init__(self, srtt: float = None, rttvar: float = None) :
+        self.srtt = srtt
+        self.rttvar = rttvar
+        self.rtt = None
+        self.timeout = None
+        self.requests = 0
+        self.retries = 0
+
+    # RTT sample in seconds, only from exchanges without retry (Karn's algorithm)
+    def add(self, rtt: float) :
+        if self.srtt == None :
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else :
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rtt = rtt
+
+    # Request timeout derived from RTT (maximum without history)
+    def rto(self, maximum: float, minimum: float) -> float :
+        if self.srtt == None :
+            return maximum
+        return min(maximum, max(minimum, self.srtt + 4 * self.rttvar))
+
+#
+# SNMP statistics of a host (loaded from cache on first use)
+# host:  host FQDN
+# return SnmpStats
+#
+def snmp_stats(host: str) -> SnmpStats :
+
+    if host not in SNMP_STATS :
+        hit, value, age = cache_util.cache_load('snmp-rtt', host)
+        SNMP_STATS[host] = (SnmpStats(value['srtt'], value['rttvar']) if hit else SnmpStats())
+
+    return SNMP_STATS[host]
+
+#
+# SNMP timeout and retries options
+# timeout: maximum timeout in seconds (used until the host RTT is known)
+# retries: number of retries
+# hedge: send a copy of late requests at half the timeout
+#
+def snmp_configure(timeout: float = 1, retries: int = 5, hedge: bool = False) :
+
+    global SNMP_TIMEOUT, SNMP_RETRIES, SNMP_HEDGE
+
+    SNMP_TIMEOUT = timeout
+    SNMP_RETRIES = retries
+    SNMP_HEDGE = hedge
+
+# Engine observer counting sent requests (retries included) and matched responses
+# Requests are sequential, the round trip is the time between the last request and its response
+def snmp_observer(snmpEngine, execpoint, variables, cbCtx) :
+    if execpoint == 'rfc3412.sendPdu' :
+        SNMP_COUNTERS['sent'] += 1
+        SNMP_COUNTERS['sent_time'] = time.monotonic()
+    else :
+        SNMP_COUNTERS['received'] += 1
+        SNMP_COUNTERS['rtt'] += time.monotonic() - SNMP_COUNTERS['sent_time']
+
+#
+# SNMP exchange accounting
+# host:  host FQDN
+# start: (sent, received, rtt) counters when the exchange started
+# success: exchange result
+# Updates the host statistics and keeps the RTT in cache
+#
+def snmp_account(host: str, start: tuple, success: bool) :
+
+    sent = SNMP_COUNTERS['sent'] - start[0]
+    received = SNMP_COUNTERS['received'] - start[1]
+    rtt = SNMP_COUNTERS['rtt'] - start[2]
+
+    # Requests of the exchange: answered ones plus the one that timed out
+    requests = received + (0 if success else 1)
+
+    stats = snmp_stats(host)
+    stats.requests += requests
+    stats.retries += max(0, sent - requests)
+
+    if success and received > 0 and sent == received :
+        stats.add(rtt / received)
+        cache_util.cache_store('snmp-rtt', host, {'srtt' : stats.srtt, 'rttvar' : stats.rttvar})
+
+#
+# SNMP request timeout and retries of a host
+# host:  host FQDN
+# hedge: hedged requests (copies at half the timeout)
+# return timeout (seconds) retries
+#
+def snmp_timeouts(host: str, hedge: bool = False) -> (float, int) :
+
+    stats = snmp_stats(host)
+
+    # Timeout from the host RTT
+    if hedge :
+        # A reply to any copy is accepted, all copies together still wait at least SNMP_TIMEOUT for a slow agent
+        timeout = stats.rto(SNMP_TIMEOUT, max(SNMP_TIMEOUT_MIN, SNMP_TIMEOUT / (SNMP_RETRIES + 1))) / 2
+        retries = SNMP_RETRIES * 2 + 1
+    else :
+        # A late reply to a previous attempt is lost, a slow agent keeps at least half of SNMP_TIMEOUT
+        timeout = stats.rto(SNMP_TIMEOUT, max(SNMP_TIMEOUT_MIN, SNMP_TIMEOUT / 2))
+        retries = SNMP_RETRIES
+    stats.timeout = timeout
+
+    return timeout, retries
+
+#
+# SNMP session
+# host:  host FQDN
+# version: SNMP version (0:v1, 1:v2)
+# community: SNMP community
+# return engine community transport context (reused for the same host, community and version)
+#
+def snmp_session(host: str, version: int = 1, community: str = 'public') -> (SnmpEngine, CommunityData, UdpTransportTarget, ContextData) :
+
+    global SNMP_ENGINE
+
+    # Engine construction (MIB builder, dispatcher) is the most expensive step
+    if SNMP_ENGINE == None :
+        SNMP_ENGINE = SnmpEngine()
+
+        # Default timer resolution (0.5s) would round sub-second timeouts up
+        dispatcher = AsyncoreDispatcher()
+        dispatcher.setTimerResolution(0.01)
+        SNMP_ENGINE.registerTransportDispatcher(dispatcher)
+
+        SNMP_ENGINE.observer.registerObserver(snmp_observer, 'rfc3412.sendPdu', 'rfc3412.receiveMessage:response')
+
+    key = (host, community, version)
+    if key not in SNMP_POOL :
+
+        # pysnmp retries get a new request-id (a late reply to the previous one is dropped), no hedging here
+        timeout, retries = snmp_timeouts(host)
+
+        SNMP_POOL[key] = (
+            CommunityData(community, mpModel=version),
+            UdpTransportTarget((host, 161), timeout=timeout, retries=retries),
+            ContextData()
+        )
+
+    return (SNMP_ENGINE,) + SNMP_POOL[key]
 
 #
 # SNMP get 
@@ -24,25 +373,27 @@ from pysnmp.hlapi import *
 #
 def snmp_get(host: str, oids: [str], version: int = 1, community: str = 'public',) -> (bool, dict, str):
 
+    if SNMP_HEDGE :
+        return snmp_hedged(snmp_get_async, host, oids, version, community)
+
     query = ()
     for oid in oids:
-        query = query + (ObjectType(ObjectIdentity(oid)),)
+        query = query + (ObjectType(ObjectIdentity(snmp_oid(oid))),)
 
     try :
 
         
         # Init SNMP request
-        SNMP_ENGINE = SnmpEngine()
-        SNMP_COMMUNITY = CommunityData(community, mpModel=version)
-        SNMP_TRANSPORT = UdpTransportTarget((host, 161))
-        SNMP_CONTEXT = ContextData()
+        SNMP_ENGINE, SNMP_COMMUNITY, SNMP_TRANSPORT, SNMP_CONTEXT = snmp_session(host, version, community)
 
         
         # Create get query
-        g = getCmd(SNMP_ENGINE,SNMP_COMMUNITY, SNMP_TRANSPORT, SNMP_CONTEXT, *query)
+        g = getCmd(SNMP_ENGINE,SNMP_COMMUNITY, SNMP_TRANSPORT, SNMP_CONTEXT, lookupMib=False, *query)
 
         # Execute query
+        start = (SNMP_COUNTERS['sent'], SNMP_COUNTERS['received'], SNMP_COUNTERS['rtt'])
         errorIndication, errorStatus, errorIndex, varBinds = next(g)
+        snmp_account(host, start, not errorIndication)
             
         # Error handler
         if errorIndication:
@@ -64,50 +415,505 @@ def snmp_get(host: str, oids: [str], version: int = 1, community: str = 'public'
     
     
 
-def snmp_table(host: str, oids: [str], version: int = 1, community: str = 'public',) -> (bool, dict, str):
+#
+# SNMP table walk
+# host:  host FQDN
+# oids: list of column OIDs
+# version: SNMP version (0:v1, 1:v2)
+# community: SNMP community
+# max_repetitions: rows per GETBULK request (v2 only, 0 to walk with GETNEXT)
+# return success (if success 1 else 0) result (SnmpTable, rows oid=>value) message
+#
+def snmp_table(host: str, oids: [str], version: int = 1, community: str = 'public', max_repetitions: int = 25) -> (bool, SnmpTable, str):
+
+    if SNMP_HEDGE :
+        return snmp_hedged(snmp_table_async, host, oids, version, community, max_repetitions)
+
     query = ()
     for oid in oids:
-        query = query + (ObjectType(ObjectIdentity(oid)),)
+        query = query + (ObjectType(ObjectIdentity(snmp_oid(oid))),)
 
     try :
 
         
         # Init SNMP request
-        SNMP_ENGINE = SnmpEngine()
-        SNMP_COMMUNITY = CommunityData(community, mpModel=version)
-        SNMP_TRANSPORT = UdpTransportTarget((host, 161))
-        SNMP_CONTEXT = ContextData()
+        SNMP_ENGINE, SNMP_COMMUNITY, SNMP_TRANSPORT, SNMP_CONTEXT = snmp_session(host, version, community)
 
         
+        # Create and execute bulk query (several rows per round trip), not available with SNMP v1
+        if version > 0 and max_repetitions > 0 :
+            g = bulkCmd(SNMP_ENGINE,SNMP_COMMUNITY, SNMP_TRANSPORT, SNMP_CONTEXT, 0, max_repetitions, lexicographicMode=False, lookupMib=False, *query)
+
         # Create and execute execute next query
-        g = nextCmd(SNMP_ENGINE,SNMP_COMMUNITY, SNMP_TRANSPORT, SNMP_CONTEXT, lexicographicMode=False, *query)
+        else :
+            g = nextCmd(SNMP_ENGINE,SNMP_COMMUNITY, SNMP_TRANSPORT, SNMP_CONTEXT, lexicographicMode=False, lookupMib=False, *query)
 
-        # Create table result
-        table = []
-        dim = len(oids)
-        index = 0
-        row = dict()
+        # Values of each column by row index (one varBinds per row)
+        columns = [snmp_oid(oid) for oid in oids]
+        cells = [dict() for oid in oids]
+        start = (SNMP_COUNTERS['sent'], SNMP_COUNTERS['received'], SNMP_COUNTERS['rtt'])
         for (errorIndication, errorStatus, errorIndex, varBinds) in g :  
         
             # Error handler
             if errorIndication:
+                snmp_account(host, start, False)
                 return False, None, str(errorIndication)
                 
             if errorStatus:
+                snmp_account(host, start, True)
                 return False, None, errorStatus.prettyPrint()
 
-            else:
-                for varBind in varBinds :
-                    row[oids[index]] = str(varBind[1])
-                    if index  == len(oids) - 1 :
-                        table.append(row)
-                        row = dict()
-                        index = 0
-                    else :
-                        index += 1
+            for column, cell, (name, value) in zip(columns, cells, varBinds) :
+                index = snmp_cell(column, name, value)
+                if index != None :
+                    cell[index] = value
 
-        return True, table, None
+        snmp_account(host, start, True)
+        return True, snmp_join(oids, cells), None
 
     except BaseException as err:  
         return False, None, format(err)
+
+#
+# SNMP walk of several subtrees in one exchange (scalars and columns of different tables)
+# host:  host FQDN
+# oids: list of subtree OIDs (table columns or scalar objects)
+# version: SNMP version (0:v1, 1:v2)
+# community: SNMP community
+# max_repetitions: rows per GETBULK request (v2 only, 0 to walk with GETNEXT)
+# return success (if success 1 else 0) result (oid=>(row index=>value)) message
+#
+def snmp_walk(host: str, oids: [str], version: int = 1, community: str = 'public', max_repetitions: int = 25) -> (bool, dict, str):
+    query = ()
+    for oid in oids:
+        query = query + (ObjectType(ObjectIdentity(snmp_oid(oid))),)
+
+    try :
+
+        # Init SNMP request
+        SNMP_ENGINE, SNMP_COMMUNITY, SNMP_TRANSPORT, SNMP_CONTEXT = snmp_session(host, version, community)
+
+        # All subtrees share the same requests, finished ones are marked as end of MIB
+        if version > 0 and max_repetitions > 0 :
+            g = bulkCmd(SNMP_ENGINE,SNMP_COMMUNITY, SNMP_TRANSPORT, SNMP_CONTEXT, 0, max_repetitions, lexicographicMode=False, lookupMib=False, *query)
+        else :
+            g = nextCmd(SNMP_ENGINE,SNMP_COMMUNITY, SNMP_TRANSPORT, SNMP_CONTEXT, lexicographicMode=False, lookupMib=False, *query)
+
+        result = {oid: {} for oid in oids}
+        start = (SNMP_COUNTERS['sent'], SNMP_COUNTERS['received'], SNMP_COUNTERS['rtt'])
+        for (errorIndication, errorStatus, errorIndex, varBinds) in g :  
+        
+            # Error handler
+            if errorIndication:
+                snmp_account(host, start, False)
+                return False, None, str(errorIndication)
+                
+            if errorStatus:
+                snmp_account(host, start, True)
+                return False, None, errorStatus.prettyPrint()
+
+            for oid, varBind in zip(oids, varBinds) :
+                if varBind[1] is not endOfMibView :
+                    # Row index is the last sub-identifier (0 for scalars)
+                    result[oid][int(varBind[0][-1])] = str(varBind[1])
+
+        snmp_account(host, start, True)
+        return True, result, None
+
+    except BaseException as err:  
+        return False, None, format(err)
+
+#
+# SNMP storage table (hrStorageTable) with a cached descr=>index map
+# host:  host FQDN
+# oids: list of column OIDs, hrStorageDescr first (e.g. descr, allocation units, size, used)
+# version: SNMP version (0:v1, 1:v2)
+# community: SNMP community
+# max_repetitions: rows per GETBULK request when walking (v2 only, 0 to walk with GETNEXT)
+# cache_ttl: seconds before walking the table again (0: always walk)
+# return success (if success 1 else 0) result (SnmpTable, like snmp_table) message
+#
+def snmp_storage_table(host: str, oids: [str], version: int = 1, community: str = 'public', max_repetitions: int = 25, cache_ttl: int = 0) -> (bool, SnmpTable, str):
+
+    # Community digest: another community may have another view of the table
+    key = '{}:{}:{}'.format(host, version, cache_util.cache_digest(community))
+
+    # Known indexes, a single GET of every column (descr included to detect re-indexed storages)
+    if cache_ttl > 0 :
+        hit, storages, age = cache_util.cache_load('snmp-storage', key, cache_ttl)
+        if hit :
+            query = []
+            for index, descr in storages :
+                for oid in oids :
+                    query.append('{}.{}'.format(oid, index))
+
+            success, result, message = snmp_get(host, query, version, community)
+
+            # No response after every retry, a walk would time out again
+            if not success and message == SNMP_NO_RESPONSE :
+                return False, None, message
+
+            if success and all(result['{}.{}'.format(oids[0], index)] == descr for index, descr in storages) :
+                try :
+                    table = SnmpTable(oids)
+                    for index, descr in storages :
+                        table.append(index, [descr] + [int(result['{}.{}'.format(oid, index)]) for oid in oids[1:]])
+                    return True, table, None
+
+                # Not a number (e.g. noSuchInstance), walk again
+                except ValueError :
+                    pass
+
+    # Unknown, expired or changed indexes, full walk (incomplete rows skipped)
+    success, table, message = snmp_table(host, oids, version, community, max_repetitions)
+    if not success :
+        return False, None, message
+
+    if cache_ttl > 0 :
+        cache_util.cache_store('snmp-storage', key, list(zip(table.indexes, table.column(oids[0]))))
+
+    return True, table, None
+
+#
+# Asyncio SNMP client, every request of the event loop goes through one UDP socket
+# Messages are built with the low level pysnmp protocol API (numeric OIDs, no MIB)
+#
+class SnmpClient(asyncio.DatagramProtocol) :
+
+    def __init__(self) :
+        self.transport = None
+        # request-id => (agent address, future)
+        self.pending = {}
+
+    def connection_made(self, transport) :
+        self.transport = transport
+
+        # Responses of hundreds of agents arrive in bursts, the default receive buffer drops some
+        try :
+            transport.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        except OSError :
+            pass
+
+    def datagram_received(self, data: bytes, addr: tuple) :
+        try :
+            pMod = api.protoModules[int(api.decodeMessageVersion(data))]
+            message, _ = decoder.decode(data, asn1Spec=pMod.Message())
+            pdu = pMod.apiMessage.getPDU(message)
+            request_id = int(pMod.apiPDU.getRequestID(pdu))
+
+            if request_id in self.pending :
+                address, future = self.pending[request_id]
+                if address == addr[0] and not future.done() :
+                    future.set_result(pdu)
+
+        # Malformed or unexpected datagram
+        except BaseException :
+            pass
+
+    def error_received(self, exc: Exception) :
+        pass
+
+    #
+    # Send a request and wait for its response
+    # address: agent IP address
+    # version: SNMP version (0:v1, 1:v2)
+    # community: SNMP community
+    # pdu: request PDU
+    # timeout: seconds before each copy of the request (same request-id, a reply to any copy is accepted)
+    # retries: number of copies after the first request
+    # stats: SnmpStats updated with the request, its copies and RTT
+    # return response PDU (None on timeout)
+    #
+    async def request(self, address: str, version: int, community: str, pdu, timeout: float = 1, retries: int = 5, stats: SnmpStats = None) :
+
+        pMod = api.protoModules[api.protoVersion1 if version == 0 else api.protoVersion2c]
+        message = pMod.Message()
+        pMod.apiMessage.setDefaults(message)
+        pMod.apiMessage.setCommunity(message, community)
+        pMod.apiMessage.setPDU(message, pdu)
+        data = encoder.encode(message)
+
+        request_id = int(pMod.apiPDU.getRequestID(pdu))
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = (address, future)
+
+        sent_time = time.monotonic()
+        copies = 0
+        response = None
+        try :
+            for attempt in range(retries + 1) :
+                self.transport.sendto(data, (address, 161))
+                copies += 1
+                try :
+                    response = await asyncio.wait_for(asyncio.shield(future), timeout)
+                    break
+                except asyncio.TimeoutError :
+                    pass
+            return response
+
+        finally :
+            del self.pending[request_id]
+
+            if stats != None :
+                stats.requests += 1
+                stats.retries += copies - 1
+                # RTT only when a single copy was sent (Karn's algorithm)
+                if response != None and copies == 1 :
+                    stats.add(time.monotonic() - sent_time)
+
+#
+# Asyncio SNMP get (same result as snmp_get)
+# client: SnmpClient
+# host:  host FQDN
+# oids: list of OIDs
+# version: SNMP version (0:v1, 1:v2)
+# community: SNMP community
+# timeout: seconds before each retry
+# retries: number of retries
+# return success (if success 1 else 0) result (oid=>value) message
+#
+async def snmp_get_async(client: SnmpClient, host: str, oids: [str], version: int = 1, community: str = 'public', timeout: float = 1, retries: int = 5) -> (bool, dict, str):
+
+    try :
+        address = (await asyncio.get_running_loop().getaddrinfo(host, 161, family=socket.AF_INET, type=socket.SOCK_DGRAM))[0][4][0]
+
+        pMod = api.protoModules[api.protoVersion1 if version == 0 else api.protoVersion2c]
+        pdu = pMod.GetRequestPDU()
+        pMod.apiPDU.setDefaults(pdu)
+        pMod.apiPDU.setVarBinds(pdu, [(snmp_oid(oid), pMod.Null('')) for oid in oids])
+
+        response = await client.request(address, version, community, pdu, timeout, retries, snmp_stats(host))
+
+        # Error handler
+        if response == None :
+            return False, None, SNMP_NO_RESPONSE
+
+        if pMod.apiPDU.getErrorStatus(response) :
+            return False, None, pMod.apiPDU.getErrorStatus(response).prettyPrint()
+
+        result = {}
+        for index, (name, value) in enumerate(pMod.apiPDU.getVarBinds(response)) :
+            result[oids[index]] = str(value)
+
+        return True, result, None
+
+    except BaseException as err:  
+        return False, None, format(err)
+
+#
+# Asyncio SNMP table walk (same result as snmp_table)
+# client: SnmpClient
+# host:  host FQDN
+# oids: list of column OIDs
+# version: SNMP version (0:v1, 1:v2)
+# community: SNMP community
+# max_repetitions: rows per GETBULK request (v2 only, 0 to walk with GETNEXT)
+# timeout: seconds before each retry
+# retries: number of retries
+# return success (if success 1 else 0) result (SnmpTable, rows oid=>value) message
+#
+async def snmp_table_async(client: SnmpClient, host: str, oids: [str], version: int = 1, community: str = 'public', max_repetitions: int = 25, timeout: float = 1, retries: int = 5) -> (bool, SnmpTable, str):
+
+    try :
+        address = (await asyncio.get_running_loop().getaddrinfo(host, 161, family=socket.AF_INET, type=socket.SOCK_DGRAM))[0][4][0]
+
+        pMod = api.protoModules[api.protoVersion1 if version == 0 else api.protoVersion2c]
+        columns = [snmp_oid(oid) for oid in oids]
+        current = columns
+        cells = [dict() for oid in oids]
+
+        while True :
+
+            # Bulk query (several rows per round trip), not available with SNMP v1
+            if version > 0 and max_repetitions > 0 :
+                pdu = pMod.GetBulkRequestPDU()
+                pMod.apiBulkPDU.setDefaults(pdu)
+                pMod.apiBulkPDU.setNonRepeaters(pdu, 0)
+                pMod.apiBulkPDU.setMaxRepetitions(pdu, max_repetitions)
+                pMod.apiBulkPDU.setVarBinds(pdu, [(oid, pMod.Null('')) for oid in current])
+            else :
+                pdu = pMod.GetNextRequestPDU()
+                pMod.apiPDU.setDefaults(pdu)
+                pMod.apiPDU.setVarBinds(pdu, [(oid, pMod.Null('')) for oid in current])
+
+            response = await client.request(address, version, community, pdu, timeout, retries, snmp_stats(host))
+
+            # Error handler
+            if response == None :
+                return False, None, SNMP_NO_RESPONSE
+
+            # SNMP v1 end of MIB
+            if version == 0 and pMod.apiPDU.getErrorStatus(response) == 2 :
+                return True, snmp_join(oids, cells), None
+
+            if pMod.apiPDU.getErrorStatus(response) :
+                return False, None, pMod.apiPDU.getErrorStatus(response).prettyPrint()
+
+            # Response rows (one variable per column), every column is walked until it leaves the table
+            varBinds = pMod.apiPDU.getVarBinds(response)
+            if len(varBinds) < len(columns) :
+                return True, snmp_join(oids, cells), None
+
+            walking = False
+            for start in range(0, len(varBinds) - len(varBinds) % len(columns), len(columns)) :
+                row = varBinds[start:start + len(columns)]
+                walking = False
+                for column, cell, (name, value) in zip(columns, cells, row) :
+                    index = snmp_cell(column, name, value)
+                    if index != None :
+                        cell[index] = value
+                        walking = True
+                current = [tuple(name) for name, value in row]
+
+            if not walking :
+                return True, snmp_join(oids, cells), None
+
+    except BaseException as err:  
+        return False, None, format(err)
+
+#
+# Hedged SNMP request (blocking), used by snmp_get/snmp_table when SNMP_HEDGE is set
+# request: snmp_get_async or snmp_table_async
+# host:  host FQDN
+# args: request arguments after host (oids, version, community...)
+# return success (if success 1 else 0) result message of the request
+#
+def snmp_hedged(request, host: str, *args) -> (bool, object, str):
+
+    timeout, retries = snmp_timeouts(host, True)
+
+    async def run() :
+        transport, client = await asyncio.get_running_loop().create_datagram_endpoint(SnmpClient, local_addr=('0.0.0.0', 0))
+        try :
+            return await request(client, host, *args, timeout=timeout, retries=retries)
+        finally :
+            transport.close()
+
+    result = asyncio.run(run())
+
+    stats = snmp_stats(host)
+    if stats.srtt != None :
+        cache_util.cache_store('snmp-rtt', host, {'srtt' : stats.srtt, 'rttvar' : stats.rttvar})
+
+    return result
+
+#
+# Asyncio SNMP poll of several hosts at once
+# hosts: list of host FQDN
+# oids: list of OIDs (column OIDs if table)
+# table: walk the columns (snmp_table) instead of getting the OIDs (snmp_get)
+# version: SNMP version (0:v1, 1:v2)
+# community: SNMP community
+# max_repetitions: rows per GETBULK request (v2 only, 0 to walk with GETNEXT)
+# timeout: seconds before each retry
+# retries: number of retries
+# concurrency: maximum number of hosts polled at the same time
+# return host=>(success result message) like snmp_get/snmp_table
+#
+async def snmp_poll_async(hosts: [str], oids: [str], table: bool = False, version: int = 1, community: str = 'public', max_repetitions: int = 25, timeout: float = 1, retries: int = 5, concurrency: int = 256) -> dict:
+
+    transport, client = await asyncio.get_running_loop().create_datagram_endpoint(SnmpClient, local_addr=('0.0.0.0', 0))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def poll(host: str) :
+        async with semaphore :
+            if table :
+                return await snmp_table_async(client, host, oids, version, community, max_repetitions, timeout, retries)
+            return await snmp_get_async(client, host, oids, version, community, timeout, retries)
+
+    try :
+        results = await asyncio.gather(*[poll(host) for host in hosts])
+    finally :
+        transport.close()
+
+    return dict(zip(hosts, results))
+
+#
+# SNMP poll of several hosts at once (blocking wrapper of snmp_poll_async)
+# return host=>(success result message) like snmp_get/snmp_table
+#
+def snmp_poll(hosts: [str], oids: [str], table: bool = False, version: int = 1, community: str = 'public', max_repetitions: int = 25, timeout: float = 1, retries: int = 5, concurrency: int = 256) -> dict:
+    return asyncio.run(snmp_poll_async(hosts, oids, table, version, community, max_repetitions, timeout, retries, concurrency))
+
+
+# Poll a host list from the command line, one JSON result per host
+# e.g. python3 -m utils.snmp_util micore1.example.intra misentry1.example.intra --oids iso.org.dod.internet.mgmt.mib-2.25.1.1.0
+if __name__ == '__main__':
+
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Poll several SNMP agents at once', usage='snmp_util.py <host> [<host> ...] --oids <oid> [<oid> ...] [options]')
+
+    parser.add_argument('hosts',
+                        nargs='*',
+                        help='Hosts to poll')
+
+    parser.add_argument('--hosts-file',
+                        dest='hosts_file',
+                        type=str,
+                        default='',
+                        help='File with one host per line')
+
+    parser.add_argument('--oids',
+                        dest='oids',
+                        nargs='+',
+                        required=True,
+                        help='OIDs to get (column OIDs with --table)')
+
+    parser.add_argument('--table',
+                        dest='table',
+                        action='store_true',
+                        help='Walk the OIDs as table columns')
+
+    parser.add_argument('--snmp-version',
+                        dest='snmp_version',
+                        type=int,
+                        default=1,
+                        help='SNMP version (0: v1, 1: v2c) (default: 1)')
+
+    parser.add_argument('--snmp-community',
+                        dest='snmp_community',
+                        type=str,
+                        default='public',
+                        help='SNMP community (default: public)')
+
+    parser.add_argument('--snmp-max-repetitions',
+                        dest='snmp_max_repetitions',
+                        type=int,
+                        default=25,
+                        help='Rows per GETBULK request for table walks, v2 only, 0 to disable (default: 25)')
+
+    parser.add_argument('--timeout',
+                        dest='timeout',
+                        type=float,
+                        default=1,
+                        help='Seconds before each retry (default: 1)')
+
+    parser.add_argument('--retries',
+                        dest='retries',
+                        type=int,
+                        default=5,
+                        help='Number of retries (default: 5)')
+
+    parser.add_argument('--concurrency',
+                        dest='concurrency',
+                        type=int,
+                        default=256,
+                        help='Maximum number of hosts polled at the same time (default: 256)')
+
+    args = parser.parse_args()
+
+    hosts = list(args.hosts)
+    if args.hosts_file != '' :
+        with open(args.hosts_file, 'r') as f :
+            hosts += [line.strip() for line in f if line.strip() != '' and not line.startswith('#')]
+
+    results = snmp_poll(hosts, args.oids, args.table, args.snmp_version, args.snmp_community, args.snmp_max_repetitions, args.timeout, args.retries, args.concurrency)
+
+    for host in hosts :
+        success, result, message = results[host]
+        if args.table and success :
+            result = [{oid: row[oid] for oid in args.oids} for row in result]
+        print(json.dumps({'host' : host, 'success' : success, 'result' : result, 'message' : message}))
 ###############################################################################################################
\ No newline at end of file
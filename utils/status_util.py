@@ -15,100 +15,163 @@
 
 import requests
 import urllib3
+from utils import http_util, cache_util
 
 urllib3.disable_warnings()
 
+# Core health marker of status page
+STATUS_CORE_OK = 'MOBILEIRON-STATUS: OK'
+
+# Connector line of status page (e.g. theConnectorNameString=CONNECTOR_01;...isHealthytrue;...)
+STATUS_CONNECTOR = 'theConnectorNameString='
+
 #
-# Check Core status
+# Parse status page in a single pass (substring tests and partition, faster than a regex per line)
+# lines: status page lines (str)
+#
+# return status ({'core' : Core OK, 'connectors' : list of [name, healthy] in page order})
+#
+def status_parse(lines) -> dict :
+
+    core = False
+    connectors = []
+    for line in lines :
+        if STATUS_CONNECTOR in line :
+            connectors.append([line.partition(STATUS_CONNECTOR)[2].partition(';')[0], 'isHealthytrue' in line])
+        elif not core and STATUS_CORE_OK in line :
+            core = True
+
+    return {'core' : core, 'connectors' : connectors}
+
+#
+# Download and parse status page (streamed, conditional: an unchanged page is not downloaded again)
 # host:  host FQDN or IP
 # port: service port
 #
-# return success (if success 1 else 0) status (0 if KO, 1 if issue, 2 if KO), error
-#
+# return success (if success 1 else 0) status (see status_parse) message timings (connect, handshake, ttfb, total in ms)
 #
-def core_status(host: str, port: int = 443) -> (bool, int, str) :
- 
+def status_fetch(host: str, port: int = 443) -> (bool, dict, str, dict) :
+
     # Perform status page request
     try:
-        r = requests.get('https://'+host+'/status/status.html', verify=False)
-
-        # if http 200 check data
-        if r.status_code == 200:
-            
-            if 'MOBILEIRON-STATUS: OK' in r.text:
-                # Core status OK
-                return True, 2, 'Core OK'
-            else:
-                # Core status KO
-                return True, 0, 'Core KO'
+        url = 'https://'+host+'/status/status.html'
+        r, status, timings = http_util.timed_lines(url, status_parse, validators=url, verify=False)
+
+        # if http 200 (or 304 with last parsed page) check data
+        if status != None:
+            return True, status, None, timings
 
         else:
-            return False, None, 'HTTP ' + r.status_code
+            return False, None, 'HTTP ' + str(r.status_code), timings
 
 
     # Handle HTTP errors
     except requests.exceptions.HTTPError as e:
-        return False, None, e.response.text
+        return False, None, e.response.text, {}
 
     # Handle others errors
     except BaseException as err:
-        return False, None, format(err)
+        return False, None, format(err), {}
 
 #
-# Check Connector(s) status
+# Fetch status page, one download shared by core and connector checks
 # host:  host FQDN or IP
 # port: service port
+# cache_ttl: seconds the parsed page is reused by other checks of the host (0: no cache)
 #
-# return exit_code, message
-#  
-def connector_status(host: str, port: int = 443) -> (bool, int, str) :
- 
-    # Perform status page request
-    try:
-        r = requests.get('https://'+host+'/status/status.html', verify=False)
-
-        # if http 200 check data
-        if r.status_code == 200:
-            
-            # Count all setup connectors
-            connectors = [line for line in r.text.split('\n') if 'theConnectorNameString' in line]
-            connectors_up = len(connectors)
-
-            connectors_OK = []
-            connectors_KO = []
-
-            # check each connectors status if used
-            if connectors_up > 0 :
-                for connector in connectors:
-                    connector_name = connector.replace('theConnectorNameString=','').split(';')[0]
-                    if 'isHealthytrue' not in connector:
-                        # Connector status K0
-                        connectors_KO.append(connector_name)
-                    else:   
-                        # Connector status OK
-                        connectors_OK.append(connector_name)
-
-                if len(connectors_OK) == 0 :
-                    return True, 0, 'DOWN: {}'.format(str(connectors_KO))
-
-                if len(connectors_OK) > 0 & len(connectors_KO) > 0:
-                    return True, 1, 'UP: {}, DOWN: {}'.format(str(connectors_OK),str(connectors_KO))
-                
-                return True, 2, 'UP: {}'.format(str(connectors_OK))
-
-            else:
-                # No connector setup
-                return False, None, 'No connector found'
+# return success (if success 1 else 0) status (see status_parse) message timings (connect, handshake, ttfb, total in ms, empty if cached)
+#
+def status_page(host: str, port: int = 443, cache_ttl: int = 0) -> (bool, dict, str, dict) :
 
-        else:
-            return False, None, 'HTTP ' + str(r.status_code)
+    if cache_ttl <= 0 :
+        return status_fetch(host, port)
 
+    key = '{}:{}'.format(host, port)
+    hit, status, age = cache_util.cache_load('status', key, cache_ttl)
+    if hit :
+        return True, status, None, {}
 
-    # Handle HTTP errors
-    except requests.exceptions.HTTPError as e:
-        return False, None, e.response.text
+    # One process downloads the page, the others wait and reuse it
+    with cache_util.cache_lock('status', key) :
 
-    # Handle others errors
-    except BaseException as err:
-        return False, None, format(err)
+        hit, status, age = cache_util.cache_load('status', key, cache_ttl)
+        if hit :
+            return True, status, None, {}
+
+        success, status, message, timings = status_fetch(host, port)
+        if success :
+            cache_util.cache_store('status', key, status)
+
+        return success, status, message, timings
+
+#
+# Core health
+# status: parsed status page
+#
+# return success (if success 1 else 0) status (0 if KO, 1 if issue, 2 if OK), message
+#
+def core_health(status: dict) -> (bool, int, str) :
+
+    if status['core'] :
+        # Core status OK
+        return True, 2, 'Core OK'
+    else:
+        # Core status KO
+        return True, 0, 'Core KO'
+
+#
+# Connector(s) health
+# status: parsed status page
+#
+# return success (if success 1 else 0) status (0 if KO, 1 if issue, 2 if OK), message
+#
+def connector_health(status: dict) -> (bool, int, str) :
+
+    # No connector setup
+    if len(status['connectors']) == 0 :
+        return False, None, 'No connector found'
+
+    connectors_OK = [name for name, healthy in status['connectors'] if healthy]
+    connectors_KO = [name for name, healthy in status['connectors'] if not healthy]
+
+    if len(connectors_OK) == 0 :
+        return True, 0, 'DOWN: {}'.format(str(connectors_KO))
+
+    if len(connectors_KO) > 0 :
+        return True, 1, 'UP: {}, DOWN: {}'.format(str(connectors_OK),str(connectors_KO))
+    
+    return True, 2, 'UP: {}'.format(str(connectors_OK))
+
+#
+# Check Core status
+# host:  host FQDN or IP
+# port: service port
+# cache_ttl: seconds the status page is reused by other checks of the host (0: no cache)
+#
+# return success (if success 1 else 0) status (0 if KO, 1 if issue, 2 if KO), error, timings (connect, handshake, ttfb, total in ms)
+#
+#
+def core_status(host: str, port: int = 443, cache_ttl: int = 0) -> (bool, int, str, dict) :
+ 
+    success, status, message, timings = status_page(host, port, cache_ttl)
+    if not success :
+        return False, None, message, timings
+
+    return core_health(status) + (timings,)
+
+#
+# Check Connector(s) status
+# host:  host FQDN or IP
+# port: service port
+# cache_ttl: seconds the status page is reused by other checks of the host (0: no cache)
+#
+# return success (if success 1 else 0) status (0 if KO, 1 if issue, 2 if KO), message, timings (connect, handshake, ttfb, total in ms)
+#  
+def connector_status(host: str, port: int = 443, cache_ttl: int = 0) -> (bool, int, str, dict) :
+ 
+    success, status, message, timings = status_page(host, port, cache_ttl)
+    if not success :
+        return False, None, message, timings
+
+    return connector_health(status) + (timings,)
 ###############################################################################################################
\ No newline at end of file
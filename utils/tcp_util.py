@@ -14,67 +14,421 @@
 #################
 
 import sys
+import os
+import errno
+import math
 import socket
+import selectors
 import time
+from collections import deque
 from timeit import default_timer as timer
 
 #
-# TCP pin 
-# host:  host FQDN
-# port: service port
-# verbose: allow printing
+# TCP connect (concurrent)
+# addresses: list of (family, sockaddr), one connection attempt each
+# timeout: timeout of each attempt in seconds
+# concurrency: maximum number of attempts in flight (None: all at once)
+# deadline: overall deadline in seconds (None: enough for every wave)
+#
+# return times (connect time in ms, -1 if failed) errors (None if passed), in the same order as addresses
+#
+def tcp_connect(addresses: [tuple], timeout: float = 1, concurrency: int = None, deadline: float = None) -> ([float], [str]) :
+
+    times = [-1] * len(addresses)
+    errors = ['timed out'] * len(addresses)
+
+    if concurrency == None or concurrency < 1 :
+        concurrency = max(len(addresses), 1)
+
+    if deadline == None :
+        deadline = timeout * math.ceil(len(addresses) / concurrency)
+
+    pending = deque(range(len(addresses)))
+    selector = selectors.DefaultSelector()
+    end = timer() + deadline
+
+    try:
+
+        while (pending or selector.get_map()) and timer() < end :
+
+            # Start attempts while slots are available
+            while pending and len(selector.get_map()) < concurrency :
+                index = pending.popleft()
+                family, sockaddr = addresses[index]
+
+                s = socket.socket(family, socket.SOCK_STREAM)
+                s.setblocking(False)
+
+                # Get t0 time and start connection
+                t0 = timer()
+                err = s.connect_ex(sockaddr)
+
+                if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK) :
+                    s.close()
+                    errors[index] = format(OSError(err, os.strerror(err)))
+                    continue
+
+                selector.register(s, selectors.EVENT_WRITE, (index, t0))
+
+            if not selector.get_map() :
+                break
+
+            # Wait until a connection completes or the nearest attempt times out
+            nearest = min(key.data[1] for key in selector.get_map().values()) + timeout
+            wait = max(min(nearest, end) - timer(), 0)
+
+            for key, _ in selector.select(wait) :
+
+                # Get t1 time
+                t1 = timer()
+
+                index, t0 = key.data
+                selector.unregister(key.fileobj)
+
+                err = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                key.fileobj.close()
+
+                if err == 0 :
+                    times[index] = (t1-t0)*1000
+                    errors[index] = None
+                else :
+                    errors[index] = format(OSError(err, os.strerror(err)))
+
+            # Drop timed out attempts
+            now = timer()
+            for key in list(selector.get_map().values()) :
+                if now >= key.data[1] + timeout :
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+
+        return times, errors
+
+    finally:
+        # Attempts still in flight at the deadline are counted as timed out
+        for key in list(selector.get_map().values()) :
+            key.fileobj.close()
+        selector.close()
+
+#
+# Streaming quantile estimator (P-square algorithm, Jain & Chlamtac)
+# Keeps 5 markers whatever the number of samples
+#
+class P2Quantile :
+
+    def __init__(self, p: float) :
+        self.p = p
+        self.q = []
+        self.n = [0, 1, 2, 3, 4]
+        self.np = [0, 2*p, 4*p, 2+2*p, 4]
+        self.dn = [0, p/2, p, (1+p)/2, 1]
+
+    def add(self, x: float) :
+
+        q = self.q
+
+        # Initialization with the first 5 samples
+        if len(q) < 5 :
+            q.append(x)
+            q.sort()
+            return
+
+        # Find cell k and update extreme markers
+        if x < q[0] :
+            q[0] = x
+            k = 0
+        elif x >= q[4] :
+            q[4] = x
+            k = 3
+        else :
+            k = 0
+            while x >= q[k+1] :
+                k += 1
+
+        for i in range(k+1, 5) :
+            self.n[i] += 1
+        for i in range(5) :
+            self.np[i] += self.dn[i]
+
+        # Adjust middle markers
+        n = self.n
+        for i in range(1, 4) :
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i+1] - n[i] > 1) or (d <= -1 and n[i-1] - n[i] < -1) :
+                d = 1 if d > 0 else -1
+
+                # Parabolic prediction
+                qp = q[i] + d / (n[i+1] - n[i-1]) * (
+                    (n[i] - n[i-1] + d) * (q[i+1] - q[i]) / (n[i+1] - n[i]) +
+                    (n[i+1] - n[i] - d) * (q[i] - q[i-1]) / (n[i] - n[i-1]))
+
+                # Linear prediction if parabolic one is out of order
+                if not q[i-1] < qp < q[i+1] :
+                    qp = q[i] + d * (q[i+d] - q[i]) / (n[i+d] - n[i])
+
+                q[i] = qp
+                n[i] += d
+
+    def value(self) -> float :
+
+        if len(self.q) == 0 :
+            return -1
+
+        # Exact value while all samples are still known
+        if self.n[4] < 5 :
+            rank = self.p * (len(self.q) - 1)
+            low = int(rank)
+            high = min(low + 1, len(self.q) - 1)
+            return self.q[low] + (self.q[high] - self.q[low]) * (rank - low)
+
+        return self.q[2]
+
+#
+# Streaming TCP connect statistics
+# Keeps min, max, mean, p50, p95, p99 and jitter without storing samples
+#
+class TcpStats :
+
+    PERCENTILES = [50, 95, 99]
+
+    def __init__(self) :
+        self.passed = 0
+        self.failed = 0
+        self.min = -1
+        self.max = -1
+        self.total = 0
+        self.jitter_total = 0
+        self.last = None
+        self.quantiles = {p: P2Quantile(p/100) for p in self.PERCENTILES}
+
+        # Name resolution time in ms and address actually probed
+        self.dns = -1
+        self.address = None
+
+    def add(self, time: float) :
+        if self.passed == 0 or time < self.min :
+            self.min = time
+        if time > self.max :
+            self.max = time
+
+        # Jitter is the mean variation between consecutive samples
+        if self.last != None :
+            self.jitter_total += abs(time - self.last)
+        self.last = time
+
+        self.total += time
+        self.passed += 1
+        for quantile in self.quantiles.values() :
+            quantile.add(time)
+
+    def add_failure(self) :
+        self.failed += 1
+
+    @property
+    def avg(self) -> float :
+        return (self.total / self.passed if self.passed > 0 else -1)
+
+    @property
+    def jitter(self) -> float :
+        return (self.jitter_total / (self.passed - 1) if self.passed > 1 else 0)
+
+    @property
+    def failed_percent(self) -> float :
+        attempts = self.passed + self.failed
+        return (self.failed / attempts * 100 if attempts > 0 else 0)
+
+    def percentile(self, p: int) -> float :
+        return self.quantiles[p].value()
+
+    # Value by name (avg, min, max, jitter, p50, p95, p99)
+    def get(self, name: str) -> float :
+        if name.startswith('p') :
+            return self.percentile(int(name[1:]))
+        return getattr(self, name)
+
+#
+# Parse TCP targets
+# targets: comma separated list of host:port, port alone uses default host ([addr]:port for IPv6)
+# default_host: host used when a target has none
+# default_port: port used when a target has none
+#
+# return list of (host, port)
+#
+def parse_targets(targets: str, default_host: str, default_port: int) -> [(str, int)] :
+
+    result = []
+    for target in targets.split(',') :
+        target = target.strip()
+        if target == '' :
+            continue
+
+        host, port = default_host, default_port
+        if target.isdigit() :
+            port = int(target)
+        elif target.startswith('[') :
+            host, _, port = target[1:].partition(']')
+            port = (int(port[1:]) if port.startswith(':') else default_port)
+        elif target.count(':') == 1 :
+            host, port = target.split(':')
+            host = (host if host != '' else default_host)
+            port = int(port)
+        else :
+            host = target
+
+        if (host, port) not in result :
+            result.append((host, port))
+
+    return result
+
+#
+# Resolve host (once, whatever the number of attempts)
+# host:  host FQDN or IP
+# family: address family (ipv4, ipv6, auto)
 #
-# return success (if success 1 else 0) time passed  failed error
+# return success (if success 1 else 0) addresses (list of (family, ip, sockaddr tail)) time (ms) error
 #
-def tcp_ping(host: str, port: int, timeout: int = 1, packets: int = 20) -> (bool, float, int, int, str) :
+FAMILIES = {
+    'ipv4' : socket.AF_INET,
+    'ipv6' : socket.AF_INET6,
+    'auto' : socket.AF_UNSPEC,
+}
 
-    def connect(host: str, port: int, timeout: int) -> (bool, int) :
+def resolve(host: str, family: str = 'ipv4') -> (bool, list, float, str) :
 
-        # Setup socket
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.settimeout(timeout)     
-       
-        try:
-            
-            # Get t0 time
-            t0 = timer()
+    try :
 
-            # Start connection
-            s.connect((host, int(port)))
+        t0 = timer()
+        infos = socket.getaddrinfo(host, None, FAMILIES[family], socket.SOCK_STREAM)
+        t1 = timer()
 
-            # Close connection
-            s.shutdown(socket.SHUT_RD)
+        addresses = []
+        for info_family, _, _, _, sockaddr in infos :
+            address = (info_family, sockaddr[0], tuple(sockaddr[2:]))
+            if address not in addresses :
+                addresses.append(address)
 
-            # Get t1 time
-            t1 = timer()
+        return True, addresses, (t1-t0)*1000, ''
+
+    except BaseException as err:
+        return False, None, -1, format(err)
+
+#
+# Happy eyeballs (RFC 8305 like) address selection
+# candidates: list of resolved addresses lists, one per target
+# port: list of ports, one per target
+# timeout: timeout in seconds
+#
+# return selected address (family, sockaddr) per target, first resolved address if none answered
+#
+def happy_eyeballs(candidates: [list], ports: [int], timeout: float = 1) -> [tuple] :
 
-            return True, (t1-t0)*1000
-        
-        # Timed Out
-        except socket.timeout:
+    # Race the first address of each family, IPv6 first
+    race = []
+    for index, addresses in enumerate(candidates) :
+        for family in [socket.AF_INET6, socket.AF_INET] :
+            for address_family, ip, tail in addresses :
+                if address_family == family :
+                    race.append((index, (family, (ip, ports[index]) + tail)))
+                    break
 
-            return False, -1
-            
+    times, _ = tcp_connect([address for _, address in race], timeout)
+
+    selected = [(family, (ip, ports[index]) + tail) for index, ((family, ip, tail), *_) in enumerate(candidates)]
+    best = [-1] * len(candidates)
+    for (index, address), time in zip(race, times) :
+        if time >= 0 and (best[index] < 0 or time < best[index]) :
+            best[index] = time
+            selected[index] = address
+
+    return selected
+
+#
+# TCP sweep
+# targets: list of (host, port)
+# timeout: timeout of each attempt in seconds
+# packets: number of attempts per target
+# concurrency: maximum number of attempts in flight, all targets included (None: all at once)
+# family: address family (ipv4, ipv6, auto: fastest of IPv6/IPv4)
+#
+# return success (if success 1 else 0) results ('host:port' => (success, stats, error)) error
+#
+def tcp_sweep(targets: [(str, int)], timeout: int = 1, packets: int = 20, concurrency: int = None, family: str = 'ipv4') -> (bool, dict, str) :
 
     try :
 
-        passed = 0
-        avg_time = 0
+        # Resolve each host once, outside of connect timing
+        resolved = {}
+        for host, port in targets :
+            if host not in resolved :
+                resolved[host] = resolve(host, family)
+
+        results = {}
+        probed = []
+        for host, port in targets :
+            success, addresses, dns, error = resolved[host]
+            if success and len(addresses) == 0 :
+                success, error = False, 'No address found'
 
-        # Perform connection test
-        for x in range(packets) :
-            success, time = connect(host, port, timeout)
-            if success :
-                avg_time += time
-                passed += 1
+            if not success :
+                results['{}:{}'.format(host, port)] = (False, None, error)
+            else :
+                probed.append((host, int(port), addresses, dns))
 
-        if passed > 0 :
-            avg_time = avg_time / passed 
+        # Select address to probe
+        if family == 'auto' :
+            selected = happy_eyeballs([addresses for _, _, addresses, _ in probed], [port for _, port, _, _ in probed], timeout)
         else :
-            avg_time = -1
+            selected = [(addresses[0][0], (addresses[0][1], port) + addresses[0][2]) for _, port, addresses, _ in probed]
+
+        # Perform connection test of every target at once
+        addresses = []
+        for address in selected :
+            addresses += [address] * packets
+
+        times, errors = tcp_connect(addresses, timeout, concurrency)
+
+        for index, (host, port, _, dns) in enumerate(probed) :
+
+            stats = TcpStats()
+            stats.dns = dns
+            stats.address = selected[index][1][0]
+            result = (True, stats, '')
+
+            for time, error in zip(times[index*packets:(index+1)*packets], errors[index*packets:(index+1)*packets]) :
+                if error == None :
+                    stats.add(time)
+
+                # Only timeouts are counted as failed attempts
+                elif error == 'timed out' :
+                    stats.add_failure()
 
-        return True, avg_time, passed, packets - passed, ''
+                else :
+                    result = (False, None, error)
+
+            results['{}:{}'.format(host, port)] = result
+
+        # Keep targets order
+        return True, {'{}:{}'.format(host, port): results['{}:{}'.format(host, port)] for host, port in targets}, ''
 
     except BaseException as err:
-        return False, -1, -1, -1, format(err)
+        return False, None, format(err)
+
+#
+# TCP pin 
+# host:  host FQDN
+# port: service port
+# timeout: timeout of each attempt in seconds
+# packets: number of attempts
+# concurrency: maximum number of attempts in flight (None: all at once)
+# family: address family (ipv4, ipv6, auto: fastest of IPv6/IPv4)
+#
+# return success (if success 1 else 0) stats (TcpStats) error
+#
+def tcp_ping(host: str, port: int, timeout: int = 1, packets: int = 20, concurrency: int = None, family: str = 'ipv4') -> (bool, TcpStats, str) :
+
+    success, results, error = tcp_sweep([(host, port)], timeout, packets, concurrency, family)
+
+    if not success :
+        return False, None, error
+
+    return results['{}:{}'.format(host, port)]
 ###############################################################################################################
\ No newline at end of file